@@ -0,0 +1,300 @@
+"""Simulates thousands of independent pazaak sets at once using NumPy
+
+Boards are represented by scores, hands by arrays of card values (0 marks a
+card already played) and all turns are applied as masked array operations.
+Only strategies with a vectorized counterpart in VECTORIZED_STRATEGIES can
+be simulated. Results are statistically equivalent to playing the sets with
+pazaak.GameSession, see compare_with_scalar_engine and
+tests/test_batch_simulator.py.
+"""
+
+import random
+
+import numpy as np
+
+import pazaak
+from computer_strategies import blackjack_like_strategy, random_strategy
+from pazaak_constants import SCORE_GOAL, OPPONENT_STAND_THRESHOLD, HAND_SIZE
+from pazaak_player import ComputerPlayer, NEUTRAL_CARDS
+from events import NullSink
+
+
+def batch_strategy(strategy_func):
+    """Decorator marking a vectorized strategy, taking arrays of states"""
+    strategy_func.vectorized = True
+    return strategy_func
+
+
+@batch_strategy
+def blackjack_like_batch(hands, self_score, opp_score, opp_stands, rng):
+    """Vectorized blackjack_like_strategy
+
+    Args:
+        hands: Players' hands, array of shape (n, hand_size). 0 marks an
+            empty slot
+        self_score: Players' current scores
+        opp_score: Opponents' scores
+        opp_stands: Whether or not opponents stand
+        rng: numpy random Generator (unused)
+
+    Returns:
+        A tuple of arrays (play_card, card_index, stand)
+    """
+    in_hand = hands != 0
+    new_score = self_score[:, None] + hands
+    opp = opp_score[:, None]
+    stands = opp_stands[:, None]
+
+    stand = ((self_score == SCORE_GOAL)
+             | (opp_score < self_score) & (self_score <= SCORE_GOAL)
+             & opp_stands)
+
+    # Play if we reach 20 or if it results in a certain win, else play to
+    # reach 19, unless opponent has 20 already. Each rule picks the first
+    # matching card.
+    wins = in_hand & ((new_score == SCORE_GOAL)
+                      | (opp < new_score) & (new_score <= SCORE_GOAL) & stands)
+    nineteen = in_hand & (new_score == SCORE_GOAL - 1) & (opp != SCORE_GOAL)
+    play_win, play_nineteen = wins.any(axis=1), nineteen.any(axis=1)
+
+    # If we're about to bust, 18 is fine as well. As in the scalar strategy,
+    # only the first card of the hand is considered.
+    first = in_hand.argmax(axis=1)
+    first_score = self_score + hands[np.arange(len(hands)), first]
+    play_eighteen = (in_hand.any(axis=1) & (self_score > SCORE_GOAL)
+                     & (first_score == SCORE_GOAL - 2)
+                     & (opp_score <= SCORE_GOAL - 2))
+
+    play_nineteen &= ~stand & ~play_win
+    play_eighteen &= ~stand & ~play_win & ~play_nineteen
+    play_win &= ~stand
+    card_index = np.select([play_win, play_nineteen, play_eighteen],
+                           [wins.argmax(axis=1), nineteen.argmax(axis=1),
+                            first], 0)
+    play_card = play_win | play_nineteen | play_eighteen
+
+    current = self_score + np.where(
+        play_card, hands[np.arange(len(hands)), card_index], 0)
+    certain_loss = (current < opp_score) & (opp_score <= SCORE_GOAL) \
+        & opp_stands
+    certain_win = (opp_score < current) & (current <= SCORE_GOAL) & opp_stands
+    stand |= ~certain_loss & (certain_win
+                              | (current > OPPONENT_STAND_THRESHOLD))
+    return play_card, card_index, stand
+
+
+@batch_strategy
+def random_batch(hands, self_score, opp_score, opp_stands, rng):
+    """Vectorized random_strategy, see blackjack_like_batch for arguments"""
+    in_hand = hands != 0
+    n_sets = len(hands)
+    play_card = in_hand.any(axis=1) & (rng.random(n_sets) < .5)
+    # Uniform choice among the cards left in hand
+    card_index = np.where(in_hand, rng.random(hands.shape), -1).argmax(axis=1)
+    stand = rng.random(n_sets) < .5
+    return play_card, card_index, stand
+
+
+def mixed_trainee_batch(random_rate):
+    """Vectorized strategy of computer_learn.record_results without a given
+    strategy: random_strategy with probability random_rate, else
+    blackjack_like_strategy
+
+    Args:
+        random_rate: Probability to play randomly in any decision
+    """
+    @batch_strategy
+    def strategy(hands, self_score, opp_score, opp_stands, rng):
+        play_random = rng.random(len(hands)) < random_rate
+        return tuple(
+            np.where(play_random, from_random, from_blackjack)
+            for from_random, from_blackjack in zip(
+                random_batch(hands, self_score, opp_score, opp_stands, rng),
+                blackjack_like_batch(hands, self_score, opp_score,
+                                     opp_stands, rng)))
+    return strategy
+
+
+VECTORIZED_STRATEGIES = {
+    blackjack_like_strategy: blackjack_like_batch,
+    random_strategy: random_batch,
+}
+
+
+def vectorized(strategy_func):
+    """Returns the vectorized counterpart of a strategy function
+
+    Vectorized strategies (marked with batch_strategy, like
+    blackjack_like_batch) are returned as they are. Raises TypeError for
+    strategies without a counterpart in VECTORIZED_STRATEGIES.
+    """
+    if strategy_func in VECTORIZED_STRATEGIES:
+        return VECTORIZED_STRATEGIES[strategy_func]
+    if getattr(strategy_func, 'vectorized', False):
+        return strategy_func
+    supported = ', '.join(func.__name__ for func in VECTORIZED_STRATEGIES)
+    raise TypeError(f"{getattr(strategy_func, '__name__', strategy_func)} "
+                    f"can't be simulated in batches. Supported strategies: "
+                    f"{supported}")
+
+
+class SetBatch:
+    """State of many independent sets. Index 0 is the player, 1 the opponent
+
+    Args:
+        hands: Array of shape (n_sets, 2, hand_size), 0 marking empty slots
+        scores: Array of shape (n_sets, 2)
+        stands: Boolean array of shape (n_sets, 2)
+        active: Index of the player taking the next turn in every set
+    """
+
+    def __init__(self, hands, scores, stands, active):
+        self.hands = np.array(hands, dtype=np.int64)
+        self.scores = np.array(scores, dtype=np.int64)
+        self.stands = np.array(stands, dtype=bool)
+        self.active = np.array(active, dtype=np.int64)
+
+    @classmethod
+    def new(cls, n_sets, rng, hand_size=HAND_SIZE):
+        """Fresh sets: hands drawn from the side deck, random first player"""
+        side_deck = np.array(ComputerPlayer.side_deck)
+        order = rng.random((n_sets * 2, len(side_deck))).argsort(axis=1)
+        hands = side_deck[order[:, :hand_size]].reshape(n_sets, 2, hand_size)
+        return cls(hands, np.zeros((n_sets, 2)), np.zeros((n_sets, 2)),
+                   rng.integers(0, 2, n_sets))
+
+    def is_over(self):
+        """Whether each set is over (a player busted or both stand)"""
+        return (self.scores > SCORE_GOAL).any(axis=1) | self.stands.all(axis=1)
+
+    def outcomes(self):
+        """Outcome of each set from the player's point of view: 1 if won,
+        0 for a draw, -1 if lost
+        """
+        player, opponent = self.scores[:, 0], self.scores[:, 1]
+        return np.select(
+            [player > SCORE_GOAL, opponent > SCORE_GOAL,
+             opponent > player, opponent < player],
+            [-1, 1, -1, 1], 0)
+
+    def play(self, strategies, rng, recorder=None):
+        """Plays all sets until they're over
+
+        Args:
+            strategies: Vectorized strategies of player and opponent
+            rng: numpy random Generator
+            recorder: Function called with (sets, self_score, opp_score,
+                opp_stands, played_card_val, stand) for every batch of
+                decisions taken by the player. Default: None
+
+        Returns:
+            The outcome of each set, see outcomes
+        """
+        neutral_cards = np.array(NEUTRAL_CARDS)
+        running = np.nonzero(~self.is_over())[0]
+        while len(running):
+            active = self.active[running]
+            drawing = ~self.stands[running, active]
+            for seat in (0, 1):
+                sets = running[drawing & (active == seat)]
+                if len(sets):
+                    self._take_turns(sets, seat, strategies[seat],
+                                     neutral_cards, rng,
+                                     recorder if seat == 0 else None)
+            self.active[running] = 1 - active
+            running = running[~self.is_over()[running]]
+        return self.outcomes()
+
+    def _take_turns(self, sets, seat, strategy, neutral_cards, rng, recorder):
+        other = 1 - seat
+        self.scores[sets, seat] += rng.choice(neutral_cards, len(sets))
+        self_score = self.scores[sets, seat]
+        opp_score = self.scores[sets, other]
+        opp_stands = self.stands[sets, other]
+        hands = self.hands[sets, seat]
+
+        play_card, card_index, stand = strategy(
+            hands, self_score, opp_score, opp_stands, rng)
+        card_val = np.where(play_card, hands[np.arange(len(sets)), card_index],
+                            0)
+        if recorder is not None:
+            recorder(sets, self_score, opp_score, opp_stands, card_val, stand)
+
+        self.hands[sets[play_card], seat, card_index[play_card]] = 0
+        self.scores[sets, seat] += card_val
+        self.stands[sets, seat] |= (self.scores[sets, seat] > SCORE_GOAL) \
+            | stand
+
+
+def simulate_sets(n_sets, player_strategy=blackjack_like_strategy,
+                  opponent_strategy=blackjack_like_strategy, seed=None,
+                  recorder=None):
+    """Plays n independent sets, each with freshly drawn hands
+
+    Args:
+        n_sets: Number of sets to play
+        player_strategy: Player's strategy function (or vectorized strategy),
+            see vectorized
+        opponent_strategy: Opponent's strategy function, see vectorized
+        seed: Seed of the random number generator. Default: None
+        recorder: See SetBatch.play
+
+    Returns:
+        The outcome of each set from the player's point of view: 1 if won,
+        0 for a draw, -1 if lost
+    """
+    rng = np.random.default_rng(seed)
+    return SetBatch.new(n_sets, rng).play(
+        (vectorized(player_strategy), vectorized(opponent_strategy)), rng,
+        recorder)
+
+
+def estimate_win_rate(n_sets=100000, player_strategy=blackjack_like_strategy,
+                      opponent_strategy=blackjack_like_strategy, seed=None):
+    """Estimates the share of sets won, drawn and lost by the player
+
+    Returns:
+        A tuple (won, drawn, lost) of fractions of the sets played
+    """
+    outcomes = simulate_sets(n_sets, player_strategy, opponent_strategy, seed)
+    return tuple(float(np.mean(outcomes == outcome)) for outcome in (1, 0, -1))
+
+
+def compare_with_scalar_engine(n_sets=20000,
+                               player_strategy=blackjack_like_strategy,
+                               opponent_strategy=random_strategy, seed=42):
+    """Plays the same matchup with the batch and the scalar engine and tests
+    whether the shares of sets won, drawn and lost agree
+
+    Returns:
+        dict mapping 'won', 'drawn' and 'lost' to a tuple (scalar share,
+        batch share, z statistic of a two-proportion z-test)
+    """
+    # Separate streams for the games and for the random module
+    seed_rng = random.Random(seed)
+    rng = random.Random(seed_rng.getrandbits(64))
+    random.seed(seed_rng.getrandbits(64))
+    session = pazaak.GameSession(
+        ComputerPlayer("Player", player_strategy),
+        ComputerPlayer("Opponent", opponent_strategy), rng=rng,
+        events=NullSink())
+    scalar = []
+    for _ in range(n_sets):
+        session.prepare_next_game()
+        winner = session.play_a_set(
+            *rng.sample([session.player, session.opponent], 2),
+            sleep_time=0)
+        scalar.append(0 if winner is None
+                      else 1 if winner is session.player else -1)
+    scalar = np.array(scalar)
+    batch = simulate_sets(n_sets, player_strategy, opponent_strategy, seed)
+
+    comparison = {}
+    for name, outcome in (('won', 1), ('drawn', 0), ('lost', -1)):
+        p_scalar = np.mean(scalar == outcome)
+        p_batch = np.mean(batch == outcome)
+        pooled = (p_scalar + p_batch) / 2
+        std_err = np.sqrt(2 * pooled * (1 - pooled) / n_sets)
+        z_stat = (p_batch - p_scalar) / std_err if std_err else 0.
+        comparison[name] = (p_scalar, p_batch, z_stat)
+    return comparison
@@ -0,0 +1,537 @@
+"""Benchmarks for the computer strategies and the dataset formats
+
+Run as a script to run the benchmark suite, e.g.
+python benchmarks.py --update-baseline to store a baseline, then
+python benchmarks.py to compare against it. See run_suite.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+
+import computer_strategies
+from computer_strategies import ml_trainee_strategy
+from model_cache import load_model
+from pazaak_constants import DECISION_TREE_DEFAULT_MODEL, \
+    RANDOM_FOREST_DEFAULT_MODEL, SCORE_GOAL, DECISION_TREE_DEFAULT_DATASET, \
+    BENCHMARK_BASELINE_FILE_NAME, BENCHMARK_RESULTS_FILE_NAME, \
+    BENCHMARK_REGRESSION_THRESHOLD
+from pazaak_player import AbstractPlayer as Player, ComputerPlayer
+from events import NullSink
+from features import get_transform
+from misc import suppress_stdout
+
+# Strategies timed by the suite. Monte Carlo is left out of the set
+# pairings, as a single set takes a second.
+SUITE_STRATEGIES = {
+    'random': computer_strategies.random_strategy,
+    'blackjack': computer_strategies.blackjack_like_strategy,
+    'decision_tree': computer_strategies.decision_tree_strategy,
+    'random_forest': computer_strategies.random_forest_strategy,
+    'compiled_decision_tree':
+        computer_strategies.compiled_decision_tree_strategy,
+    'compiled_random_forest':
+        computer_strategies.compiled_random_forest_strategy,
+    'optimal': computer_strategies.optimal_strategy,
+    'monte_carlo': computer_strategies.monte_carlo_strategy,
+}
+SLOW_STRATEGIES = {'monte_carlo'}
+
+
+def random_decision_states(n_states, seed=42):
+    """Random decision states as passed to strategy functions
+
+    Args:
+        n_states: Number of states to generate
+        seed: Seed of the random number generator
+
+    Returns:
+        A list of tuples (self_hand, self_score, opp_score, opp_stands)
+    """
+    rng = random.Random(seed)
+    side_deck = ComputerPlayer.side_deck
+    return [(rng.sample(side_deck, rng.randint(0, 4)),
+             rng.randint(2, SCORE_GOAL + 10),
+             rng.randint(0, SCORE_GOAL),
+             rng.random() < 0.3)
+            for _ in range(n_states)]
+
+
+def per_row_ml_strategy(self_hand, self_score, opp_score, opp_stands,
+                        model_file_name):
+    """Reference implementation of ml_trainee_strategy predicting the score
+    of each candidate action with a separate predict call
+    """
+    regressor = load_model(model_file_name)
+
+    play_card, card_index, stand = False, 0, False
+    score_threshold = -10
+    extended_hand = self_hand + [0]
+
+    for indx, card_val in enumerate(extended_hand):
+        for will_stand in [True, False]:
+            score = regressor.predict(get_transform(regressor).transform(
+                self_score, opp_score, opp_stands, card_val, will_stand))[0]
+            if score >= score_threshold:
+                score_threshold = score
+                if card_val == 0:
+                    play_card, card_index, stand = False, 0, will_stand
+                else:
+                    play_card, card_index, stand = True, indx, will_stand
+
+    return (play_card, card_index, stand)
+
+
+def decisions_per_second(strategy_func, states):
+    """Measures the throughput of a strategy function
+
+    Args:
+        strategy_func: Strategy function to benchmark
+        states: Decision states, see random_decision_states
+
+    Returns:
+        The number of decisions per second
+    """
+    start = timer()
+    for state in states:
+        strategy_func(*state)
+    return len(states) / (timer() - start)
+
+
+def benchmark_ml_strategies(n_decisions=500,
+                            model_file_names=(DECISION_TREE_DEFAULT_MODEL,
+                                              RANDOM_FOREST_DEFAULT_MODEL)):
+    """Compares per-row and batched candidate scoring of ml_trainee_strategy
+
+    Args:
+        n_decisions: Number of decisions to time per model
+        model_file_names: Models to benchmark
+
+    Returns:
+        dict mapping model file name to a tuple (per-row decisions/sec,
+        batched decisions/sec). Models failing to load are left out.
+    """
+    states = random_decision_states(n_decisions)
+    results = {}
+    for model_file_name in model_file_names:
+        # Loads the model, so that we're not timing deserialization
+        try:
+            load_model(model_file_name)
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"Skipping {model_file_name}: {type(error).__name__}",
+                  file=sys.stderr)
+            continue
+        per_row = decisions_per_second(
+            lambda *state: per_row_ml_strategy(
+                *state, model_file_name=model_file_name), states)
+        batched = decisions_per_second(
+            lambda *state: ml_trainee_strategy(
+                *state, model_file_name=model_file_name), states)
+        results[model_file_name] = (per_row, batched)
+        print(f"{model_file_name}: {per_row:.0f} decisions/sec per row, "
+              f"{batched:.0f} decisions/sec batched "
+              f"({batched / per_row:.1f}x)")
+    return results
+
+
+def benchmark_dataset_formats(dataset_file_name=DECISION_TREE_DEFAULT_DATASET,
+                              repeat=5):
+    """Compares file size and load time (computer_learn.load_dataset) of a
+    dataset stored as csv and as binary dataset file
+
+    Args:
+        dataset_file_name: Dataset to convert, csv or binary
+        repeat: Number of loads timed per format. The fastest one counts.
+
+    Returns:
+        dict mapping 'csv' and 'binary' to a tuple (file size in bytes,
+        load time in seconds)
+    """
+    # Imported here, as computer_learn imports sklearn
+    from computer_learn import load_dataset, read_columns, save_dataset
+
+    df = pd.DataFrame(read_columns(dataset_file_name))
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, extension in (('csv', '.csv'), ('binary', '.pzd')):
+            file_name = os.path.join(directory, 'dataset' + extension)
+            save_dataset(df, file_name)
+            load_times = []
+            for _ in range(repeat):
+                start = timer()
+                load_dataset(file_name)
+                load_times.append(timer() - start)
+            results[name] = (os.path.getsize(file_name), min(load_times))
+
+    (csv_size, csv_time), (binary_size, binary_time) = results.values()
+    print(f"{len(df)} rows: csv {csv_size / 2**20:.2f} MB loaded in "
+          f"{csv_time * 1000:.1f} ms, binary {binary_size / 2**20:.2f} MB "
+          f"loaded in {binary_time * 1000:.1f} ms "
+          f"({csv_size / binary_size:.1f}x smaller, "
+          f"{csv_time / binary_time:.1f}x faster)")
+    return results
+
+
+def measure(func, number=1, repeat=5, warmup=1):
+    """Times a function
+
+    Args:
+        func: Function to call without arguments
+        number: Calls per round
+        repeat: Number of timed rounds
+        warmup: Number of untimed calls before the first round
+
+    Returns:
+        The median time per call over all rounds, in seconds
+    """
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = timer()
+        for _ in range(number):
+            func()
+        times.append((timer() - start) / number)
+    return statistics.median(times)
+
+
+def available_strategies(strategies=None):
+    """Strategies of SUITE_STRATEGIES that can be used. Strategies missing
+    their model or table (or failing to load it) are left out.
+
+    Returns:
+        dict mapping names to strategy functions
+    """
+    if strategies is None:
+        strategies = SUITE_STRATEGIES
+    state = random_decision_states(1)[0]
+    available = {}
+    for name, strategy_func in strategies.items():
+        try:
+            strategy_func(*state)
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"Skipping {name}: {type(error).__name__}", file=sys.stderr)
+        else:
+            available[name] = strategy_func
+    return available
+
+
+def _metric(value, unit, higher_is_better):
+    return {'value': value, 'unit': unit,
+            'higher_is_better': higher_is_better}
+
+
+def benchmark_decision_latency(strategies, n_decisions=200, repeat=5):
+    """Median latency of a single decision of each strategy
+
+    Returns:
+        dict mapping metric names to metrics (value in seconds)
+    """
+    states = random_decision_states(n_decisions)
+    results = {}
+    for name, strategy_func in strategies.items():
+        sample = states[:10] if name in SLOW_STRATEGIES else states
+
+        def decide_all(strategy_func=strategy_func, sample=sample):
+            for state in sample:
+                strategy_func(*state)
+
+        latency = measure(decide_all, repeat=repeat) / len(sample)
+        results[f'decision_latency.{name}'] = _metric(latency, 's', False)
+    return results
+
+
+def benchmark_sets(strategies, n_sets=200, repeat=3, seed=42):
+    """Sets per second played by pazaak.GameSession.play_a_set for every
+    pairing of strategies (memoized, as in the game)
+
+    Returns:
+        dict mapping metric names to metrics (value in sets per second)
+    """
+    # Imported here, as pazaak creates the default players
+    import pazaak
+
+    names = [name for name in strategies if name not in SLOW_STRATEGIES]
+    results = {}
+    for player_name, opponent_name in itertools.combinations_with_replacement(
+            names, 2):
+        session = pazaak.GameSession(
+            Player.create_computer("Player", strategies[player_name]),
+            Player.create_computer("Opponent", strategies[opponent_name]),
+            random.Random(seed), events=NullSink())
+
+        def play_sets(session=session):
+            for _ in range(n_sets):
+                session.prepare_next_game()
+                session.play_a_set(session.player, session.opponent, 0)
+
+        sets_per_sec = n_sets / measure(play_sets, repeat=repeat)
+        results[f'sets_per_sec.{player_name}_vs_{opponent_name}'] = \
+            _metric(sets_per_sec, 'sets/s', True)
+    return results
+
+
+def benchmark_dataset_generation(learning_sets=2000, repeat=3, seed=42):
+    """Throughput of dataset generation by the scalar engine
+    (computer_learn.play_learning_sets) and the batch simulator
+    (computer_learn.simulate_dataset)
+
+    Returns:
+        dict mapping metric names to metrics (value in sets per second)
+    """
+    # Imported here, as computer_learn imports sklearn
+    import computer_learn
+
+    def play_scalar():
+        computer_learn.dataset.clear()
+        computer_learn.outcomes.clear()
+        computer_learn.play_learning_sets(learning_sets,
+                                          rng=random.Random(seed))
+
+    batch_sets = learning_sets * 10
+    scalar = measure(play_scalar, repeat=repeat)
+    batch = measure(lambda: computer_learn.simulate_dataset(batch_sets,
+                                                            seed=seed),
+                    repeat=repeat)
+    return {
+        'dataset_sets_per_sec.scalar': _metric(learning_sets / scalar,
+                                               'sets/s', True),
+        'dataset_sets_per_sec.batch': _metric(batch_sets / batch,
+                                              'sets/s', True),
+    }
+
+
+def benchmark_models(dataset_file_name=DECISION_TREE_DEFAULT_DATASET,
+                     model_file_names=(DECISION_TREE_DEFAULT_MODEL,
+                                       RANDOM_FOREST_DEFAULT_MODEL),
+                     repeat=3):
+    """Fit time of the default models and load time of the model files
+    (uncached)
+
+    Returns:
+        dict mapping metric names to metrics (value in seconds)
+    """
+    # Imported here, as computer_learn imports sklearn
+    from joblib import load
+    from sklearn.base import clone
+    from sklearn.tree import DecisionTreeRegressor
+    from sklearn.ensemble import RandomForestRegressor
+    from computer_learn import load_dataset, fit_model
+
+    results = {}
+    X, y = load_dataset(dataset_file_name)
+    for name, model in (
+            ('decision_tree', DecisionTreeRegressor(max_depth=3,
+                                                    random_state=42)),
+            ('random_forest', RandomForestRegressor(max_depth=4,
+                                                    random_state=42))):
+        results[f'model_fit.{name}'] = _metric(
+            measure(lambda model=model: fit_model(clone(model), X, y),
+                    repeat=repeat, warmup=0), 's', False)
+
+    for model_file_name in model_file_names:
+        name = os.path.splitext(os.path.basename(model_file_name))[0]
+        try:
+            load(model_file_name)
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"Skipping {model_file_name}: {type(error).__name__}",
+                  file=sys.stderr)
+            continue
+        results[f'model_load.{name}'] = _metric(
+            measure(lambda file_name=model_file_name: load(file_name),
+                    repeat=repeat), 's', False)
+    return results
+
+
+def benchmark_dataset_files(dataset_file_name=DECISION_TREE_DEFAULT_DATASET,
+                            repeat=3):
+    """Size and load time of a dataset stored as csv and as binary dataset
+    file, see benchmark_dataset_formats
+
+    Returns:
+        dict mapping metric names to metrics (sizes in bytes, load times in
+        seconds)
+    """
+    results = {}
+    for name, (size, load_time) in benchmark_dataset_formats(
+            dataset_file_name, repeat).items():
+        results[f'dataset_load.{name}'] = _metric(load_time, 's', False)
+        results[f'dataset_size.{name}'] = _metric(size, 'B', False)
+    return results
+
+
+def benchmark_candidate_scoring(n_decisions=500):
+    """Throughput of ml_trainee_strategy scoring the candidate actions per
+    row and batched, see benchmark_ml_strategies
+
+    Returns:
+        dict mapping metric names to metrics (value in decisions per second)
+    """
+    results = {}
+    for model_file_name, (per_row, batched) in benchmark_ml_strategies(
+            n_decisions).items():
+        name = os.path.splitext(os.path.basename(model_file_name))[0]
+        results[f'ml_decisions_per_sec.per_row.{name}'] = _metric(
+            per_row, 'dec/s', True)
+        results[f'ml_decisions_per_sec.batched.{name}'] = _metric(
+            batched, 'dec/s', True)
+    return results
+
+
+def import_time(module='pazaak', repeat=5):
+    """Time needed to import a module in a fresh interpreter, as reported
+    by python -X importtime
+
+    Args:
+        module: Module to import. Default: 'pazaak', the game's entry point
+        repeat: Number of interpreters started. The fastest one counts.
+
+    Returns:
+        Cumulative import time of the module, in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stderr
+        for line in output.splitlines():
+            if line.count('|') != 2:
+                continue
+            _, cumulative, name = line.split('|')
+            if name.strip() == module:
+                times.append(int(cumulative) / 1e6)
+    return min(times)
+
+
+def benchmark_startup(repeat=5):
+    """Import time of the game and of the modules loading ML dependencies
+
+    Returns:
+        dict mapping metric names to metrics (value in seconds)
+    """
+    return {f'import_time.{module}': _metric(import_time(module, repeat),
+                                             's', False)
+            for module in ('pazaak', 'computer_learn')}
+
+
+def compare(results, baseline, threshold=BENCHMARK_REGRESSION_THRESHOLD):
+    """Compares results with a baseline
+
+    Args:
+        results: dict mapping metric names to metrics, see run_suite
+        baseline: Results of an earlier run
+        threshold: Relative slowdown flagged as a regression, e.g. .2 for
+            20% fewer sets per second or 20% more latency
+
+    Returns:
+        dict mapping the names of metrics found in both to a tuple
+        (ratio of current to baseline value, whether it's a regression)
+    """
+    comparison = {}
+    for name, metric in results.items():
+        if name not in baseline or not baseline[name]['value']:
+            continue
+        ratio = metric['value'] / baseline[name]['value']
+        if metric['higher_is_better']:
+            regression = ratio < 1 - threshold
+        else:
+            regression = ratio > 1 + threshold
+        comparison[name] = (ratio, regression)
+    return comparison
+
+
+def run_suite(output_file_name=BENCHMARK_RESULTS_FILE_NAME,
+              baseline_file_name=BENCHMARK_BASELINE_FILE_NAME,
+              threshold=BENCHMARK_REGRESSION_THRESHOLD, update_baseline=False,
+              quick=False):
+    """Runs all benchmarks, writes the results as JSON and compares them
+    with the stored baseline
+
+    Args:
+        output_file_name: JSON file to write the results to
+        baseline_file_name: JSON file containing the baseline, as written by
+            an earlier run
+        threshold: Relative slowdown flagged as a regression
+        update_baseline: Whether to store the results as new baseline
+        quick: Whether to use smaller sample sizes, for a rough picture
+
+    Returns:
+        A tuple (results, regressions): results as written to the output
+        file, regressions a list of metric names
+    """
+    np.random.seed(42)
+    random.seed(42)
+    scale = 5 if quick else 1
+    strategies = available_strategies()
+    results = {}
+    with suppress_stdout():
+        results.update(benchmark_decision_latency(strategies,
+                                                  200 // scale))
+        results.update(benchmark_sets(strategies, 200 // scale))
+        results.update(benchmark_dataset_generation(2000 // scale))
+        results.update(benchmark_models())
+        results.update(benchmark_dataset_files())
+        results.update(benchmark_candidate_scoring(500 // scale))
+        results.update(benchmark_startup())
+
+    with open(output_file_name, 'w') as output_file:
+        json.dump(results, output_file, indent=2, sort_keys=True)
+
+    comparison = {}
+    if os.path.exists(baseline_file_name) and not update_baseline:
+        with open(baseline_file_name) as baseline_file:
+            comparison = compare(results, json.load(baseline_file), threshold)
+    regressions = [name for name, (_, regression) in comparison.items()
+                   if regression]
+
+    for name, metric in sorted(results.items()):
+        line = f"{name:55} {metric['value']:12.6g} {metric['unit']:6}"
+        if name in comparison:
+            ratio, regression = comparison[name]
+            line += f" {ratio:6.2f}x baseline"
+            if regression:
+                line += "  REGRESSION"
+        print(line)
+
+    if update_baseline:
+        with open(baseline_file_name, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print(f"Stored results as baseline in {baseline_file_name}.")
+    elif regressions:
+        print(f"{len(regressions)} regressions beyond {threshold:.0%}.")
+    return results, regressions
+
+
+def main():
+    """Command line entry point of the benchmark suite"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=BENCHMARK_RESULTS_FILE_NAME,
+                        help="JSON file to write the results to")
+    parser.add_argument('--baseline', default=BENCHMARK_BASELINE_FILE_NAME,
+                        help="JSON file containing the baseline")
+    parser.add_argument('--threshold', type=float,
+                        default=BENCHMARK_REGRESSION_THRESHOLD,
+                        help="Relative slowdown flagged as a regression")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Store the results as new baseline")
+    parser.add_argument('--quick', action='store_true',
+                        help="Use smaller sample sizes")
+    args = parser.parse_args()
+    _, regressions = run_suite(args.output, args.baseline, args.threshold,
+                               args.update_baseline, args.quick)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
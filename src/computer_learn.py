@@ -1,133 +1,689 @@
 """Trains a machine learning model on a dataset created by create_dataset"""
 
+import json
+import os
 import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from timeit import default_timer as timer
 import functools
-from joblib import dump
+from joblib import dump, load
 
 import pandas as pd
 import numpy as np
 from sklearn.tree import DecisionTreeRegressor, export_graphviz
 from sklearn.ensemble import  RandomForestRegressor
 from sklearn.model_selection import train_test_split
+from sklearn.neural_network import MLPRegressor
 
 from computer_strategies import blackjack_like_strategy as bls
 from computer_strategies import random_strategy as rds
+from computer_strategies import not_memoized
 import pazaak
-from pazaak_player import AbstractPlayer as Player
+from pazaak_player import AbstractPlayer as Player, ComputerPlayer
 from pazaak_constants import DATASET_FILE_NAME, MODEL_FILE_NAME, \
+    DATASET_MANIFEST_FILE_NAME, DATASET_FLUSH_SIZE, \
+    FINAL_ACTION_REWARD, OTHER_ACTION_REWARD, \
     GRAPHVIZ_FILE_NAME, DECISION_TREE_DEFAULT_DATASET, \
     DECISION_TREE_DEFAULT_MODEL, RANDOM_FOREST_DEFAULT_DATASET, \
-    RANDOM_FOREST_DEFAULT_MODEL
-from misc import suppress_stdout
-
-
-dataset = pd.DataFrame(
-        columns=['self_score', 'opp_score', 'opp_stands',
-                 'result_card_val', 'result_stand', 'score'],
-        dtype=float)
-
-
-def create_dataset(learning_sets=1000, strategy_func=None):
+    RANDOM_FOREST_DEFAULT_MODEL, POLICY_FILE_NAME, \
+    DECISION_TREE_DEFAULT_POLICY, RANDOM_FOREST_DEFAULT_POLICY, \
+    POLICY_MIN_SCORE, POLICY_MAX_SCORE
+from events import NullSink, GameOver
+from profiling import strategy_name
+from dataset_buffer import ColumnarBuffer
+from dataset_file import is_dataset_file, write_dataset, open_dataset, \
+    write_header, concatenate_datasets
+from replay import ReplayWriter, ReplayLog
+from batch_simulator import simulate_sets, mixed_trainee_batch
+from features import FeatureTransform, get_transform, set_transform
+
+
+DATASET_COLUMNS = [('episode', np.int32), ('step', np.int16),
+                   ('self_score', np.int8), ('opp_score', np.int8),
+                   ('opp_stands', np.bool_), ('result_card_val', np.int8),
+                   ('result_stand', np.bool_)]
+# Outcome of every set (episode) from the trainee's perspective:
+# 1 if won, 0 for a draw, -1 if lost
+OUTCOME_COLUMNS = [('episode', np.int32), ('outcome', np.int8)]
+
+dataset = ColumnarBuffer(DATASET_COLUMNS)
+outcomes = ColumnarBuffer(OUTCOME_COLUMNS)
+episode, step = 0, 0
+
+
+def create_dataset(learning_sets=1000, strategy_func=None,
+                   dataset_file_name=DATASET_FILE_NAME, replay_file_name=None,
+                   flush_size=DATASET_FLUSH_SIZE, seed=None, resume=False):
     """Creates the dataset supplied to a machine learning model
 
     Args:
         learning_sets: Number of sets to play in order to create the
-            dataset. Default: 1000
+            dataset, at least 1. Default: 1000
         strategy_func: Strategy function to use by player. If None is passed,
             it will be chosen at random in every iteration
-
-    Uses record_results_strategy to obtain a pandas dataframe containing
-    parameters, actions taken and score. We assign the following score
-    values:
+        dataset_file_name: File to write the dataset to, see save_dataset.
+            Default: DATASET_FILE_NAME
+        replay_file_name: File to log all turns to, see replay module.
+            Default: None (not logged)
+        flush_size: Number of sets kept in memory before they are written
+            to disk and checkpointed, at least 1. Default: DATASET_FLUSH_SIZE
+        seed: Seed of the games and of the random module. Default: None
+            (unseeded)
+        resume: Whether to continue an interrupted run from its last
+            checkpoint rather than starting over. Raises ValueError if the
+            checkpoint was created with different arguments (strategies are
+            compared by name).
+
+    Uses record_results to record parameters and actions taken, tagged with
+    the set (episode) and the index of the decision within the set (step).
+    The outcome of every set is stored in a separate table. Once all sets
+    are played, label_rewards assigns the following score values:
      * If the set was won, 1 point for the last action, .3 for all others
      * If the set ends with a draw, 0 points for all actions
      * If the set was lost, -1 point for the last action, -.3 for all others
-     Writes the results in DATASET_FILE_NAME (result.csv) file
+     Writes the results in dataset_file_name (a binary dataset file by
+     default) and the set outcomes in a csv file next to it (see
+     outcomes_file_for), to be relabeled by relabel_dataset.
+
+    Sets are played flush_size at a time. Every chunk is labeled and written
+    to a part file in the directory dataset_file_name + '.parts', then a
+    checkpoint of the counters and the states of the random number
+    generators is written next to the parts. Parts and checkpoints replace
+    their files atomically, so an interrupted run resumes from its last
+    chunk and creates the same dataset as an uninterrupted run. The parts
+    are merged once all sets are played.
+    """
+    if learning_sets < 1 or flush_size < 1:
+        raise ValueError(f"At least 1 set has to be played and flushed, got "
+                         f"learning_sets={learning_sets}, "
+                         f"flush_size={flush_size}")
+    parts_dir = dataset_file_name + '.parts'
+    checkpoint_file_name = os.path.join(parts_dir, 'checkpoint.json')
+    arguments = {'learning_sets': learning_sets, 'flush_size': flush_size,
+                 'seed': seed, 'replay_file_name': replay_file_name,
+                 'strategy_func': None if strategy_func is None
+                                  else strategy_name(strategy_func)}
+    rng = random.Random()
+    if resume and os.path.exists(checkpoint_file_name):
+        with open(checkpoint_file_name) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        mismatched = [name for name, value in arguments.items()
+                      if checkpoint['arguments'][name] != value]
+        if mismatched:
+            raise ValueError(f"Checkpoint created with different "
+                             f"{', '.join(mismatched)}: "
+                             f"{checkpoint['arguments']}")
+        rng.setstate(_to_random_state(checkpoint['rng_state']))
+        random.setstate(_to_random_state(checkpoint['random_state']))
+        print(f"Resuming after {checkpoint['sets_done']} of {learning_sets} "
+              f"sets.")
+    else:
+        if os.path.isdir(parts_dir):
+            shutil.rmtree(parts_dir)
+        os.makedirs(parts_dir)
+        if seed is not None:
+            # Strategies (and record_results) use the random module as well,
+            # with a stream apart from the games'
+            seed_rng = random.Random(seed)
+            rng.seed(seed_rng.getrandbits(64))
+            random.seed(seed_rng.getrandbits(64))
+        checkpoint = {'arguments': arguments, 'sets_done': 0, 'parts': [],
+                      'counts': [0, 0, 0], 'decisions': 0, 'nbytes': 0,
+                      'elapsed': 0., 'replay': None}
+
+    events = None
+    if replay_file_name is not None:
+        replay_state = checkpoint['replay']
+        if replay_state is not None:
+            # Drop the sets logged after the checkpoint
+            os.truncate(replay_file_name, replay_state['size'])
+        events = ReplayWriter(replay_file_name, "MLTrainee", "Opponent",
+                              append=replay_state is not None)
+        if replay_state is not None:
+            events.games, events.sets = replay_state['games'], \
+                replay_state['sets']
+    try:
+        while checkpoint['sets_done'] < learning_sets:
+            _play_dataset_part(checkpoint, parts_dir, rng, events,
+                               min(flush_size,
+                                   learning_sets - checkpoint['sets_done']),
+                               strategy_func)
+            _save_checkpoint(checkpoint, checkpoint_file_name, rng)
+    finally:
+        if events is not None:
+            events.close()
+
+    part_names = [os.path.join(parts_dir, part['dataset'])
+                  for part in checkpoint['parts']]
+    if dataset_file_name.endswith('.csv'):
+        for indx, part_name in enumerate(part_names):
+            write_csv(pd.DataFrame(read_columns(part_name)),
+                      dataset_file_name, append=indx > 0)
+    else:
+        concatenate_datasets(part_names, dataset_file_name + '.tmp')
+        os.replace(dataset_file_name + '.tmp', dataset_file_name)
+    for indx, part in enumerate(checkpoint['parts']):
+        pd.DataFrame(read_columns(os.path.join(
+            parts_dir, part['outcomes']))).to_csv(
+                outcomes_file_for(dataset_file_name), index=False,
+                mode='a' if indx else 'w',
+                header=not indx)
+    shutil.rmtree(parts_dir)
+
+    sets_won, draws, sets_lost = checkpoint['counts']
+    total_time = checkpoint['elapsed']
+    decisions = checkpoint['decisions']
+    print(f"MLTrainee won {sets_won} sets. Draws: {draws}. Lost: {sets_lost}")
+    print(f"Played a total of {learning_sets} sets in {total_time:.2f} "
+          f"seconds. This accounts to {learning_sets / total_time:.1f} sets "
+          f"and {decisions / total_time:.1f} decisions per second.")
+    print(f"Recorded {decisions} decisions using "
+          f"{checkpoint['nbytes'] / max(decisions, 1):.1f} bytes of buffer "
+          f"memory per decision, "
+          f"in {len(part_names)} parts of at most {flush_size} sets.")
+
+
+def _play_dataset_part(checkpoint, parts_dir, rng, events, part_sets,
+                       strategy_func):
+    """Plays the sets of the next part of create_dataset, labels them and
+    writes them to the parts directory. Updates the checkpoint dict.
+    """
+    dataset.clear()
+    outcomes.clear()
+    start = timer()
+    counts = play_learning_sets(part_sets, strategy_func, rng,
+                                checkpoint['sets_done'], events)
+    elapsed = timer() - start
+
+    indx = len(checkpoint['parts'])
+    part = {'dataset': f"part_{indx:05d}.pzd",
+            'outcomes': f"outcomes_{indx:05d}.pzd"}
+    columns = {name: dataset.column(name) for name in dataset.names}
+    columns['score'] = label_rewards(columns['episode'], columns['step'],
+                                     outcomes.column('episode'),
+                                     outcomes.column('outcome'))
+    for file_name, part_columns, rewards in (
+            (part['dataset'], columns,
+             {'final': FINAL_ACTION_REWARD, 'other': OTHER_ACTION_REWARD}),
+            (part['outcomes'], {name: outcomes.column(name)
+                                for name in outcomes.names}, None)):
+        file_name = os.path.join(parts_dir, file_name)
+        write_dataset(file_name + '.tmp', part_columns, rewards)
+        os.replace(file_name + '.tmp', file_name)
+
+    if events is not None:
+        checkpoint['replay'] = {'size': events.flush(sync=True),
+                                'games': events.games, 'sets': events.sets}
+    checkpoint['parts'].append(part)
+    checkpoint['counts'] = [total + count for total, count
+                            in zip(checkpoint['counts'], counts)]
+    checkpoint['decisions'] += len(dataset)
+    checkpoint['nbytes'] += dataset.nbytes
+    checkpoint['sets_done'] += part_sets
+    checkpoint['elapsed'] += elapsed
+
+
+def _save_checkpoint(checkpoint, checkpoint_file_name, rng):
+    """Atomically writes the checkpoint of create_dataset, including the
+    states of rng and of the random module
+    """
+    checkpoint['rng_state'] = rng.getstate()
+    checkpoint['random_state'] = random.getstate()
+    with open(checkpoint_file_name + '.tmp', 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(checkpoint_file_name + '.tmp', checkpoint_file_name)
+
+
+def _to_random_state(state):
+    """Converts a random state read from json back to the tuples of
+    random.getstate
+    """
+    version, internal_state, gauss_next = state
+    return version, tuple(internal_state), gauss_next
+
+
+def play_learning_sets(learning_sets, strategy_func=None, rng=None,
+                       first_episode=0, events=None):
+    """Plays sets against the blackjack strategy, recording the trainee's
+    decisions in dataset and the set outcomes in outcomes
+
+    Args:
+        learning_sets: Number of sets to play
+        strategy_func: Strategy function to use by player, see record_results
+        rng: Random number generator of the game session. Default: None
+            (unseeded)
+        first_episode: Episode id of the first set
+        events: Sink receiving the game events. Default: None (dropped)
+
+    Returns:
+        A tuple (sets_won, draws, sets_lost)
     """
+    global episode, step
 
     player_strategy_func = functools.partial(record_results,
                                              strategy_func=strategy_func)
 
-    pazaak.player = Player.create_computer(
-        "MLTrainee", strategy_func=player_strategy_func)
-    pazaak.opponent = Player.create_computer("Opponent", strategy_func=bls)
+    session = pazaak.GameSession(
+        Player.create_computer("MLTrainee", strategy_func=player_strategy_func),
+        Player.create_computer("Opponent", strategy_func=bls),
+        rng=rng, events=NullSink() if events is None else events)
 
     sets_won, draws, sets_lost = 0, 0, 0
+    session.setup_game()
+
+    for episode in range(first_episode, first_episode + learning_sets):
+        step = 0
+        winner = session.play_a_set(
+            *session.rng.sample([session.player, session.opponent], 2),
+            sleep_time=0)
+        if winner is None:
+            outcomes.append(episode, 0)
+            draws += 1
+        elif winner is session.player:
+            outcomes.append(episode, 1)
+            sets_won += 1
+        else:
+            outcomes.append(episode, -1)
+            sets_lost += 1
+        # Every set is played with new hands, i.e. it's a game of its own
+        session.events.emit(GameOver,
+                            None if winner is None else winner.name)
+        session.prepare_next_game()
+
+    return sets_won, draws, sets_lost
+
+
+def create_dataset_parallel(learning_sets=50000, shards=None,
+                            strategy_func=None, seed=None,
+                            manifest_file_name=DATASET_MANIFEST_FILE_NAME):
+    """Creates a dataset like create_dataset, playing in several processes
+
+    Every process plays its share of the sets with its own seed, derived
+    from the master seed, and writes the unlabeled decisions and set
+    outcomes to shard files. Episode ids are unique across all shards.
+    The shards are listed in a json manifest, to be merged by merge_shards.
+
+    Args:
+        learning_sets: Total number of sets to play. Default: 50000
+        shards: Number of shards (and processes). Default: number of CPUs
+        strategy_func: Strategy function to use by player, see
+            record_results. Has to be picklable.
+        seed: Master seed. Default: None (random seed)
+        manifest_file_name: File to write the manifest to. Shard files are
+            written next to it. Default: DATASET_MANIFEST_FILE_NAME
+
+    Returns:
+        The manifest (a dict), as written to manifest_file_name
+    """
+    if shards is None:
+        shards = os.cpu_count() or 1
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    seed_rng = random.Random(seed)
+    base_name = os.path.splitext(manifest_file_name)[0]
+
+    shard_specs, first_episode = [], 0
+    for indx in range(shards):
+        shard_sets = learning_sets // shards + (indx < learning_sets % shards)
+        shard_specs.append({
+            'dataset': f"{base_name}_{indx}.pzd",
+            'outcomes': f"{base_name}_{indx}_outcomes.pzd",
+            'first_episode': first_episode,
+            'sets': shard_sets,
+            'seed': seed_rng.getrandbits(64),
+            'random_seed': seed_rng.getrandbits(64),
+        })
+        first_episode += shard_sets
+
     start = timer()
+    with ProcessPoolExecutor(max_workers=shards) as executor:
+        results = list(executor.map(
+            _create_shard, shard_specs, [strategy_func] * shards))
+    total_time = timer() - start
+
+    sets_won, draws, sets_lost = (sum(counts) for counts in zip(*results))
+    print(f"MLTrainee won {sets_won} sets. Draws: {draws}. Lost: {sets_lost}")
+    print(f"Played a total of {learning_sets} sets in {total_time:.2f} "
+          f"seconds using {shards} processes. This accounts to "
+          f"{learning_sets / total_time:.1f} sets per second.")
+
+    manifest = {'seed': seed, 'learning_sets': learning_sets,
+                'shards': shard_specs}
+    with open(manifest_file_name, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+
+def _create_shard(shard, strategy_func):
+    """Plays the sets of a shard and writes them, see create_dataset_parallel
 
-    pazaak.setup_game()
-
-    with suppress_stdout():
-        for _ in range(0, learning_sets):
-            winner = pazaak.play_a_set(
-                *random.sample([pazaak.player, pazaak.opponent], 2),
-                sleep_time=0)
-            if winner is None:
-                dataset.fillna(0, inplace=True)
-                draws += 1
-            elif winner.name == "MLTrainee":
-                dataset.fillna(.3, inplace=True)
-                dataset.iloc[-1, 5] = 1
-                sets_won += 1
-            else:
-                dataset.fillna(-.3, inplace=True)
-                dataset.iloc[-1, 5] = -1
-                sets_lost += 1
-            pazaak.prepare_next_game()
-
-    dataset.to_csv(DATASET_FILE_NAME, index=False)
+    Returns:
+        A tuple (sets_won, draws, sets_lost)
+    """
+    # Strategies (and record_results) use the random module as well, seeded
+    # apart from the games' generator
+    random.seed(shard['random_seed'])
+    dataset.clear()
+    outcomes.clear()
+    counts = play_learning_sets(shard['sets'], strategy_func,
+                                random.Random(shard['seed']),
+                                shard['first_episode'])
+    for buffer, file_name in ((dataset, shard['dataset']),
+                              (outcomes, shard['outcomes'])):
+        write_dataset(file_name, {name: buffer.column(name)
+                                  for name in buffer.names})
+    return counts
+
+
+def merge_shards(manifest_file_name=DATASET_MANIFEST_FILE_NAME,
+                 dataset_file_name=DATASET_FILE_NAME,
+                 outcomes_file_name=None):
+    """Merges the shards written by create_dataset_parallel and labels them
+
+    Args:
+        manifest_file_name: Manifest written by create_dataset_parallel
+        dataset_file_name: File to write the labeled dataset to, to be used
+            by train_model, see save_dataset. Default: DATASET_FILE_NAME
+        outcomes_file_name: csv file to write the set outcomes to, to be used
+            by relabel_dataset. Default: None (see outcomes_file_for)
+    """
+    if outcomes_file_name is None:
+        outcomes_file_name = outcomes_file_for(dataset_file_name)
+    with open(manifest_file_name) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    df, set_outcomes = (
+        pd.DataFrame({name: np.concatenate([
+            np.asarray(read_columns(shard[table])[name])
+            for shard in manifest['shards']]) for name, _ in columns})
+        for table, columns in (('dataset', DATASET_COLUMNS),
+                               ('outcomes', OUTCOME_COLUMNS)))
+    df['score'] = label_rewards(df.episode.values, df.step.values,
+                                set_outcomes.episode.values,
+                                set_outcomes.outcome.values)
+    save_dataset(df, dataset_file_name)
+    set_outcomes.to_csv(outcomes_file_name, index=False)
+
+
+def create_dataset_batch(learning_sets=50000, random_rate=.1, seed=None,
+                         dataset_file_name=DATASET_FILE_NAME):
+    """Creates a dataset like create_dataset, simulating all sets at once
+    with the vectorized batch_simulator
+
+    Args:
+        learning_sets: Number of sets to play. Default: 50000
+        random_rate: Probability that the trainee plays randomly rather than
+            using the blackjack strategy, as in record_results. Default: .1
+        seed: Seed of the random number generator. Default: None
+        dataset_file_name: File to write the dataset to, see save_dataset.
+            Default: DATASET_FILE_NAME
+
+    Writes the same files as create_dataset.
+    """
+    start = timer()
+    df, set_outcomes = simulate_dataset(learning_sets, random_rate, seed)
     end = timer()
-    total_time = int(end - start)
-    sets_per_sec = learning_sets / total_time
 
-    print(f"MLTrainee won {sets_won} sets. Draws: {draws}. Lost: {sets_lost}")
-    print(f"Played a total of {learning_sets} sets in {total_time} seconds. "
-          f"This accounts to {sets_per_sec} sets per second.")
+    save_dataset(df, dataset_file_name)
+    pd.DataFrame({'episode': np.arange(learning_sets),
+                  'outcome': set_outcomes}).to_csv(
+                      outcomes_file_for(dataset_file_name), index=False)
+
+    total_time = end - start
+    print(f"MLTrainee won {np.sum(set_outcomes == 1)} sets. "
+          f"Draws: {np.sum(set_outcomes == 0)}. "
+          f"Lost: {np.sum(set_outcomes == -1)}")
+    print(f"Played a total of {learning_sets} sets in {total_time:.2f} "
+          f"seconds. This accounts to {learning_sets / total_time:.1f} sets "
+          f"and {len(df) / total_time:.1f} decisions per second.")
+
+
+def simulate_dataset(learning_sets, random_rate=.1, seed=None):
+    """Plays sets with the vectorized batch_simulator and labels the
+    trainee's decisions, see create_dataset_batch
+
+    Args:
+        learning_sets: Number of sets to play
+        random_rate: Probability that the trainee plays randomly rather than
+            using the blackjack strategy
+        seed: Seed or numpy random Generator. Default: None
+
+    Returns:
+        A tuple (df, set_outcomes): The labeled decisions and the outcome of
+        every set
+    """
+    steps = np.zeros(learning_sets, np.int16)
+    records = []
+
+    def recorder(sets, self_score, opp_score, opp_stands, card_val, stand):
+        records.append((sets, steps[sets], self_score, opp_score, opp_stands,
+                        card_val, stand))
+        steps[sets] += 1
+
+    set_outcomes = simulate_sets(learning_sets,
+                                 mixed_trainee_batch(random_rate), bls,
+                                 seed, recorder)
+
+    columns = [np.concatenate(column) for column in zip(*records)]
+    order = np.lexsort((columns[1], columns[0]))
+    df = pd.DataFrame({name: column[order].astype(dtype)
+                       for (name, dtype), column
+                       in zip(DATASET_COLUMNS, columns)})
+    df['score'] = label_rewards(df.episode.values, df.step.values,
+                                np.arange(learning_sets), set_outcomes)
+    return df, set_outcomes
+
+
+def stream_batches(learning_sets=1000000, batch_sets=1000, random_rate=.1,
+                   seed=None, transform=None):
+    """Self-play generating labeled mini batches, one batch at a time
+
+    Each batch consists of the decisions of batch_sets sets played with the
+    vectorized batch_simulator, see simulate_dataset. Batches are generated
+    on demand, so memory doesn't depend on learning_sets.
+
+    Args:
+        learning_sets: Total number of sets to play. Default: 1000000
+        batch_sets: Number of sets per batch. Default: 1000
+        random_rate: Probability that the trainee plays randomly rather than
+            using the blackjack strategy. Default: .1
+        seed: Seed or numpy random Generator. Default: None
+        transform: Feature transform, see features module. Default: None
+            (the default FeatureTransform)
+
+    Yields:
+        Tuples (X, y) of features and scores, see load_dataset
+    """
+    rng = np.random.default_rng(seed)
+    for first_set in range(0, learning_sets, batch_sets):
+        df, _ = simulate_dataset(min(batch_sets, learning_sets - first_set),
+                                 random_rate, rng)
+        yield engineer_features(df, transform), df.score
+
+
+def train_streaming(regressor=None, learning_sets=1000000, batch_sets=1000,
+                    random_rate=.1, seed=None, checkpoint_interval=100,
+                    model_file_name=MODEL_FILE_NAME, transform=None):
+    """Trains a model incrementally on self-play batches, without storing a
+    dataset
+
+    The model is fed with stream_batches through partial_fit. Every
+    checkpoint_interval batches (and at the end), it's scored on a held-out
+    batch and dumped to model_file_name, replacing the file atomically.
+    Strategies using the file (see ml_trainee_strategy) pick up the new
+    checkpoint on their own, see model_cache.
+
+    Args:
+        regressor: Model supporting partial_fit. Default: MLPRegressor
+        learning_sets: Total number of sets to play. Default: 1000000
+        batch_sets: Number of sets per batch. Default: 1000
+        random_rate: Probability that the trainee plays randomly rather than
+            using the blackjack strategy. Default: .1
+        seed: Seed of the random number generator. Default: None
+        checkpoint_interval: Number of batches between checkpoints
+        model_file_name: joblib dump of model. Default: MODEL_FILE_NAME
+        transform: Feature transform, dumped with the model. Default: None
+            (the default FeatureTransform)
+
+    Returns:
+        The trained model
+    """
+    if regressor is None:
+        regressor = MLPRegressor(hidden_layer_sizes=(32, 16),
+                                 random_state=42)
+    set_transform(regressor, transform)
+    rng = np.random.default_rng(seed)
+    X_test, y_test = next(stream_batches(batch_sets, batch_sets, random_rate,
+                                         rng, transform))
+
+    start, decisions = timer(), 0
+    n_batches = -(-learning_sets // batch_sets)
+    batches = stream_batches(learning_sets, batch_sets, random_rate, rng,
+                             transform)
+    for indx, (X, y) in enumerate(batches, 1):
+        regressor.partial_fit(X.values, y.values)
+        decisions += len(X)
+        if indx % checkpoint_interval == 0 or indx == n_batches:
+            dump_model(regressor, model_file_name)
+            score = regressor.score(X_test.values, y_test.values)
+            print(f"{min(indx * batch_sets, learning_sets)} sets, "
+                  f"{decisions / (timer() - start):.0f} decisions per "
+                  f"second. Score on the test batch: {score:.4f}.")
+    return regressor
+
+
+def dump_model(regressor, model_file_name=MODEL_FILE_NAME):
+    """Dumps a model, atomically replacing model_file_name, so that readers
+    never see a partially written file
+    """
+    temp_file_name = f"{model_file_name}.{os.getpid()}.tmp"
+    dump(regressor, temp_file_name)
+    os.replace(temp_file_name, model_file_name)
 
 
 def train_model(regressor=DecisionTreeRegressor(max_depth=3, random_state=42),
                 dataset_file_name=DATASET_FILE_NAME,
-                model_file_name=MODEL_FILE_NAME):
+                model_file_name=MODEL_FILE_NAME, transform=None):
     """Trains a model with the dataset obtained by create_dataset
 
     Args:
         regressor: The model to use. Default: DecisionTreeRegressor
-        dataset_file_name: csv file to train model. Default: DATASET_FILE_NAME
+        dataset_file_name: Dataset to train model, either a binary dataset
+            file or a csv file. Default: DATASET_FILE_NAME
         model_file_name: joblib dump of model: Default: MODEL_FILE_NAME
+        transform: Feature transform, dumped with the model. Default: None
+            (the default FeatureTransform)
 
         Outputs the model in the file passed in argument model_file_name to
         be imported by the ml_trainee_strategy in computer_strategies module
     """
-    df = pd.read_csv(dataset_file_name)
+    X, y = load_dataset(dataset_file_name, transform)
+    score = fit_model(regressor, X, y, transform)
+    print(f"Score on the test set: {score}.")
+    if isinstance(regressor, DecisionTreeRegressor):
+        export_graphviz(regressor, feature_names=list(X.columns),
+                        out_file=GRAPHVIZ_FILE_NAME, filled=True)
+
+    # For persistence, we export the generated model
+    dump(regressor, model_file_name)
+    return score
+
+
+def load_dataset(dataset_file_name=DATASET_FILE_NAME, transform=None):
+    """Reads a dataset created by create_dataset and engineers the features
+    used by the models
+
+    Args:
+        dataset_file_name: Binary dataset file (memory mapped) or csv file to
+            read. Default: DATASET_FILE_NAME
+        transform: Feature transform, see features module. Default: None
+            (the default FeatureTransform)
+
+    Returns:
+        A tuple (X, y) of features and scores
+    """
+    columns = read_columns(dataset_file_name)
+    return engineer_features(columns, transform), pd.Series(
+        np.asarray(columns['score']), name='score')
+
+
+def engineer_features(columns, transform=None):
+    """Computes the features used by the models from dataset columns
+
+    Args:
+        columns: Mapping of column names to arrays, e.g. a DataFrame
+        transform: Feature transform, see features module. Default: None
+            (the default FeatureTransform)
+
+    Returns:
+        DataFrame of features
+    """
+    if transform is None:
+        transform = FeatureTransform()
+    features = transform.transform(
+        columns['self_score'], columns['opp_score'], columns['opp_stands'],
+        columns['result_card_val'], columns['result_stand'])
+    return pd.DataFrame(features, columns=list(transform.names))
 
-    # A minumum amount of feature engineering: The player's and opponent's
-    # exact score may not be that important for our decisions. The difference,
-    # however, certainly is. Moreover, the card value itself is not that
-    # important. Here, the sum is.
-    df['score_difference'] = df.self_score - df.opp_score
-    df.drop(columns=['opp_score'], inplace=True)
-    df['score_if_card_played'] = df.self_score + df.result_card_val
-    df.drop(columns=['result_card_val'], inplace=True)
 
+def fit_model(regressor, X, y, transform=None):
+    """Fits a model on a training split of the dataset
+
+    Args:
+        regressor: The model to fit
+        X: Features, see load_dataset
+        y: Scores
+        transform: Feature transform X was computed with, stored with the
+            model. Default: None (the default FeatureTransform)
+
+    Returns:
+        The model's score on the test split
+    """
     # Strategy will be to let our model predict the score for different actions
     # Hence, we're going to train the model on that now
-    X, y = df.drop(columns='score'), df.score
-    X_train, X_test, y_train, y_test = train_test_split(X, y, random_state=42)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X.values, y.values, random_state=42)
     regressor.fit(X_train, y_train)
+    set_transform(regressor, transform)
+    return regressor.score(X_test, y_test)
 
-    feature_names = ['self_score', 'opp_stands', 'result_stand',
-                     'score_difference', 'score_if_card_played']
 
-    score = regressor.score(X_test, y_test)
-    print(f"Score on the test set: {score}.")
-    if isinstance(regressor, DecisionTreeRegressor):
-        export_graphviz(regressor, feature_names=feature_names,
-                        out_file=GRAPHVIZ_FILE_NAME, filled=True)
+def compile_model(model_file_name=MODEL_FILE_NAME,
+                  policy_file_name=POLICY_FILE_NAME):
+    """Compiles a model dumped by train_model into a policy lookup table
 
-    # For persistence, we export the generated model
-    dump(regressor, model_file_name)
-    return score
+    Args:
+        model_file_name: joblib dump of model. Default: MODEL_FILE_NAME
+        policy_file_name: File to write the table to. Default: POLICY_FILE_NAME
+
+    The model is evaluated once for every combination of self_score,
+    opp_score (both within POLICY_MIN_SCORE and POLICY_MAX_SCORE),
+    opp_stands, card value played (0 meaning no card) and stand. The
+    predicted scores are written to policy_file_name as an array
+    indexed in this order, to be used by compiled_policy_strategy without
+    any sklearn at runtime.
+    """
+    regressor = load(model_file_name)
+
+    scores = np.arange(POLICY_MIN_SCORE, POLICY_MAX_SCORE + 1)
+    card_vals = np.arange(min(ComputerPlayer.side_deck),
+                          max(ComputerPlayer.side_deck) + 1)
+    self_score, opp_score, opp_stands, card_val, stand = (
+        axis.ravel() for axis in np.meshgrid(
+            scores, scores, [0, 1], card_vals, [0, 1], indexing='ij'))
+
+    features = get_transform(regressor).transform(
+        self_score, opp_score, opp_stands, card_val, stand)
+    table = regressor.predict(features).reshape(
+        len(scores), len(scores), 2, len(card_vals), 2)
+
+    np.savez_compressed(policy_file_name, table=table,
+                        min_score=POLICY_MIN_SCORE, min_card=card_vals[0])
+    print(f"Compiled {model_file_name} into {policy_file_name} "
+          f"({table.size} entries).")
 
 
 def train_decision_tree():
@@ -144,6 +700,17 @@ def train_random_forest():
                 model_file_name=RANDOM_FOREST_DEFAULT_MODEL)
 
 
+def compile_decision_tree():
+    """Shorthand method for compiling the standard decision tree"""
+    compile_model(DECISION_TREE_DEFAULT_MODEL, DECISION_TREE_DEFAULT_POLICY)
+
+
+def compile_random_forest():
+    """Shorthand method for compiling the standard random forest"""
+    compile_model(RANDOM_FOREST_DEFAULT_MODEL, RANDOM_FOREST_DEFAULT_POLICY)
+
+
+@not_memoized
 def record_results(self_hand, self_score, opp_score, opp_stands,
                    strategy_func=None):
     """Plays using a given strategy and records the results
@@ -152,8 +719,6 @@ def record_results(self_hand, self_score, opp_score, opp_stands,
         strategy_func: Strategy function to use by player. If None is passed,
             it will be chosen at random in every iteration
     """
-    global dataset
-
     # We want our trainee to make mistakes. However, too many mistakes may not
     # result in a valuable learn dataset. Hence, we're chosing our blackjack
     # strategy over a coplete random strategy, depending on a random value
@@ -161,12 +726,191 @@ def record_results(self_hand, self_score, opp_score, opp_stands,
         strategy_func = bls if random.random() < 0.9 else rds
     play_card, card_index, stand = strategy_func(
         self_hand, self_score, opp_score, opp_stands)
-    dataset = dataset.append({
-        'self_score': self_score,
-        'opp_score': opp_score,
-        'opp_stands': opp_stands,
-        'result_card_val': self_hand[card_index] if play_card else 0,
-        'result_stand': stand,
-        'score': np.nan
-    }, ignore_index=True)
+    global step
+
+    dataset.append(episode, step, self_score, opp_score, opp_stands,
+                   self_hand[card_index] if play_card else 0, stand)
+    step += 1
     return (play_card, card_index, stand)
+
+
+def label_rewards(episodes, steps, outcome_episodes, outcome_values,
+                  final_reward=FINAL_ACTION_REWARD,
+                  other_reward=OTHER_ACTION_REWARD):
+    """Assigns the reward of every recorded decision in one vectorized pass
+
+    Args:
+        episodes: Episode (set) of every decision
+        steps: Index of every decision within its episode
+        outcome_episodes: Episodes in the outcome table
+        outcome_values: Outcome of these episodes: 1 if won, 0 for a draw,
+            -1 if lost
+        final_reward: Reward for the last action of a won set. Negated for
+            lost sets. Default: FINAL_ACTION_REWARD
+        other_reward: Reward for all other actions of a won set. Negated for
+            lost sets. Default: OTHER_ACTION_REWARD
+
+    Returns:
+        float32 array containing the reward of every decision
+    """
+    episodes = np.asarray(episodes)
+    steps = np.asarray(steps)
+    if not len(episodes):
+        return np.empty(0, np.float32)
+
+    n_episodes = max(episodes.max(), np.max(outcome_episodes)) + 1
+    outcome = np.zeros(n_episodes, np.float32)
+    outcome[outcome_episodes] = outcome_values
+    last_step = np.full(n_episodes, -1, steps.dtype)
+    np.maximum.at(last_step, episodes, steps)
+
+    rewards = np.where(steps == last_step[episodes],
+                       final_reward, other_reward).astype(np.float32)
+    return rewards * outcome[episodes]
+
+
+def outcomes_file_for(dataset_file_name):
+    """Name of the csv file the set outcomes of a dataset are written to,
+    e.g. resources/result_outcomes.csv for resources/result.pzd
+    """
+    return f"{os.path.splitext(dataset_file_name)[0]}_outcomes.csv"
+
+
+def relabel_dataset(dataset_file_name=DATASET_FILE_NAME,
+                    outcomes_file_name=None,
+                    final_reward=FINAL_ACTION_REWARD,
+                    other_reward=OTHER_ACTION_REWARD):
+    """Recomputes the scores of a dataset created by create_dataset with a
+    different reward scheme, without playing the sets again
+
+    Args:
+        dataset_file_name: File created by create_dataset, overwritten. The
+            scores of a binary dataset file are rewritten in place.
+        outcomes_file_name: csv file containing the outcome of each set.
+            Default: None (the file written with the dataset, see
+            outcomes_file_for)
+        final_reward: Reward for the last action of a won set
+        other_reward: Reward for all other actions of a won set
+    """
+    if outcomes_file_name is None:
+        outcomes_file_name = outcomes_file_for(dataset_file_name)
+    set_outcomes = pd.read_csv(outcomes_file_name)
+    if not is_dataset_file(dataset_file_name):
+        df = pd.read_csv(dataset_file_name)
+        df['score'] = label_rewards(df.episode.values, df.step.values,
+                                    set_outcomes.episode.values,
+                                    set_outcomes.outcome.values,
+                                    final_reward, other_reward)
+        write_csv(df, dataset_file_name)
+        return
+
+    header, columns = open_dataset(dataset_file_name, 'r+')
+    columns['score'][:] = label_rewards(
+        columns['episode'], columns['step'], set_outcomes.episode.values,
+        set_outcomes.outcome.values, final_reward, other_reward)
+    if isinstance(columns['score'], np.memmap):
+        columns['score'].flush()
+    header['rewards'] = {'final': final_reward, 'other': other_reward}
+    write_header(dataset_file_name, header)
+
+
+def dataset_from_replay(replay_file_name, dataset_file_name=None, seat=0,
+                        final_reward=FINAL_ACTION_REWARD,
+                        other_reward=OTHER_ACTION_REWARD):
+    """Derives a dataset like create_dataset from a replay log, without
+    playing the sets again
+
+    Every set of the log is an episode.
+
+    Args:
+        replay_file_name: Log written by a replay.ReplayWriter
+        dataset_file_name: File to write the dataset to, see save_dataset.
+            Default: None (not written)
+        seat: Seat of the player whose decisions are used, 0 for the player
+            and 1 for the opponent. Default: 0
+        final_reward: Reward for the last action of a won set
+        other_reward: Reward for all other actions of a won set
+
+    Returns:
+        DataFrame containing the DATASET_COLUMNS and the score
+    """
+    records = ReplayLog(replay_file_name).records
+    records = records[records['seat'] == seat]
+    episodes = records['set'].astype(np.int64)
+    # Decisions of the seat per set, numbered in order
+    first = np.r_[True, episodes[1:] != episodes[:-1]]
+    starts = np.flatnonzero(first)
+    steps = np.arange(len(records)) - np.repeat(starts, np.diff(
+        np.r_[starts, len(records)]))
+
+    df = pd.DataFrame({name: column.astype(dtype) for (name, dtype), column
+                       in zip(DATASET_COLUMNS, (
+                           episodes, steps, records['self_score'],
+                           records['opp_score'], records['opp_stands'],
+                           records['card_val'], records['stand']))})
+    df['score'] = label_rewards(df.episode.values, df.step.values,
+                                episodes[starts], records['outcome'][starts],
+                                final_reward, other_reward)
+    if dataset_file_name is not None:
+        save_dataset(df, dataset_file_name, final_reward, other_reward)
+    return df
+
+
+def read_columns(dataset_file_name):
+    """Reads a binary dataset file (memory mapped) or a csv file
+
+    Returns:
+        Mapping of column names to arrays
+    """
+    if is_dataset_file(dataset_file_name):
+        return open_dataset(dataset_file_name)[1]
+    return pd.read_csv(dataset_file_name)
+
+
+def save_dataset(df, file_name, final_reward=FINAL_ACTION_REWARD,
+                 other_reward=OTHER_ACTION_REWARD):
+    """Writes a labeled dataset: to a csv file if file_name ends with .csv,
+    else to a binary dataset file using the types of DATASET_COLUMNS
+
+    Args:
+        df: The dataset
+        file_name: The file to write
+        final_reward: Reward scheme the scores were labeled with, stored in
+            the header of binary dataset files
+        other_reward: See final_reward
+    """
+    if file_name.endswith('.csv'):
+        write_csv(df, file_name)
+        return
+    dtypes = dict(DATASET_COLUMNS + [('score', np.float32)])
+    write_dataset(file_name, df.astype({name: dtypes[name] for name in df
+                                        if name in dtypes}),
+                  {'final': final_reward, 'other': other_reward})
+
+
+def export_csv(dataset_file_name=DATASET_FILE_NAME, csv_file_name=None):
+    """Exports a binary dataset file to csv
+
+    Args:
+        dataset_file_name: The binary dataset file. Default: DATASET_FILE_NAME
+        csv_file_name: csv file to write. Default: dataset_file_name with a
+            .csv extension
+    """
+    if csv_file_name is None:
+        csv_file_name = os.path.splitext(dataset_file_name)[0] + '.csv'
+    write_csv(pd.DataFrame(read_columns(dataset_file_name)), csv_file_name)
+
+
+def write_csv(df, file_name, append=False):
+    """Writes a dataset to a csv file, booleans written as 0 / 1
+
+    Args:
+        df: The dataset
+        file_name: The file to write
+        append: Whether to append to an existing file rather than
+            overwriting it. No header is written when appending.
+    """
+    df.astype({name: np.int8 for name in df.columns
+               if df[name].dtype == np.bool_}).to_csv(
+                   file_name, index=False, mode='a' if append else 'w',
+                   header=not append)
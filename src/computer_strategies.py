@@ -1,13 +1,152 @@
-"""Collection of strategies to be used by Computer Player"""
+"""Collection of strategies to be used by Computer Player
+
+NumPy (and, through the model cache, joblib and sklearn) is only imported
+by the strategies using it, once they're first called. Games between
+heuristic strategies start without loading any of them.
+"""
 
 import random
-from joblib import load
+import functools
+from collections import OrderedDict
+from timeit import default_timer as timer
 
 from pazaak_constants import SCORE_GOAL, OPPONENT_STAND_THRESHOLD, \
+                             HAND_SIZE, MONTE_CARLO_TIME_BUDGET, \
+                             MONTE_CARLO_MAX_ROLLOUTS, MONTE_CARLO_BATCH_SIZE, \
+                             MONTE_CARLO_CONFIDENCE, STRATEGY_CACHE_SIZE, \
                              MODEL_FILE_NAME, DECISION_TREE_DEFAULT_MODEL, \
-                             RANDOM_FOREST_DEFAULT_MODEL
+                             RANDOM_FOREST_DEFAULT_MODEL, POLICY_FILE_NAME, \
+                             DECISION_TREE_DEFAULT_POLICY, \
+                             RANDOM_FOREST_DEFAULT_POLICY, \
+                             OPTIMAL_POLICY_FILE_NAME
+from model_cache import load_model, model_signature
+
+
+class MemoizedStrategy:
+    """Strategy function caching its decisions by canonical state
+
+    The hand is canonicalized as a sorted multiset, so the wrapped strategy
+    is always called with a sorted hand. The card to play is cached by value
+    and mapped back to an index in the caller's hand. The least recently
+    used decisions are evicted once maxsize decisions are cached.
+
+    Decisions of a strategy using a model file are only valid for the model
+    they were made with. The cache is cleared whenever the file changes,
+    checked through the model cache (see model_cache.model_signature).
+
+    Args:
+        strategy_func: Deterministic strategy function, deciding the same
+            regardless of the order of the hand
+        maxsize: Maximum number of cached decisions
+        model_file_name: File the strategy loads its model from. Default:
+            None (no model file)
+    """
+
+    def __init__(self, strategy_func, maxsize=STRATEGY_CACHE_SIZE,
+                 model_file_name=None):
+        functools.update_wrapper(self, strategy_func)
+        self.strategy_func = strategy_func
+        self.maxsize = maxsize
+        self.model_file_name = model_file_name
+        self._model_signature = None
+        self._decisions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __call__(self, self_hand, self_score, opp_score, opp_stands):
+        if self.model_file_name is not None:
+            signature = model_signature(self.model_file_name)
+            if signature != self._model_signature:
+                self._decisions.clear()
+                self._model_signature = signature
+        hand = tuple(sorted(self_hand))
+        key = (hand, self_score, opp_score, bool(opp_stands))
+        decision = self._decisions.get(key)
+        if decision is not None:
+            self.hits += 1
+            self._decisions.move_to_end(key)
+        else:
+            self.misses += 1
+            play_card, card_index, stand = self.strategy_func(
+                list(hand), self_score, opp_score, opp_stands)
+            decision = (play_card, hand[card_index] if play_card else None,
+                        stand)
+            self._decisions[key] = decision
+            if len(self._decisions) > self.maxsize:
+                self._decisions.popitem(last=False)
+                self.evictions += 1
+
+        play_card, card_val, stand = decision
+        if play_card:
+            return (True, self_hand.index(card_val), stand)
+        return (False, 0, stand)
+
+    def clear(self):
+        """Removes all cached decisions and resets the counters. Required if
+        the strategy's model changes.
+        """
+        self._decisions.clear()
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def stats(self):
+        """Cache statistics
+
+        Returns:
+            dict containing hits, misses, evictions and number of cached
+            decisions
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._decisions)}
+
+
+def not_memoized(strategy_func):
+    """Decorator marking a strategy not to be memoized by memoize_strategy,
+    e.g. since it's stochastic or cheaper than a cache lookup
+    """
+    strategy_func.memoize = False
+    return strategy_func
 
 
+def memoize_strategy(strategy_func, maxsize=STRATEGY_CACHE_SIZE):
+    """Memoizes a strategy function, see MemoizedStrategy
+
+    Strategies marked with not_memoized (also if wrapped in a
+    functools.partial) and strategies memoized already are returned as they
+    are. The model file of strategies marked with uses_model_file is
+    watched, see MemoizedStrategy.
+    """
+    func, keywords = strategy_func, {}
+    while isinstance(func, functools.partial):
+        keywords = {**func.keywords, **keywords}
+        func = func.func
+    if (isinstance(strategy_func, MemoizedStrategy)
+            or not getattr(func, 'memoize', True)):
+        return strategy_func
+
+    model_file_name = None
+    # Strategies passed a fitted model don't load one
+    if hasattr(func, 'model_file') and keywords.get('regressor') is None:
+        default, keyword = func.model_file
+        model_file_name = keywords.get(keyword, default)
+    return MemoizedStrategy(strategy_func, maxsize, model_file_name)
+
+
+def uses_model_file(default, keyword=None):
+    """Decorator declaring the file a strategy loads its model from, so that
+    memoized decisions are dropped once it changes
+
+    Args:
+        default: The model file
+        keyword: Name of the strategy's argument overriding the file, if any
+    """
+    def decorate(strategy_func):
+        strategy_func.model_file = (default, keyword)
+        return strategy_func
+    return decorate
+
+
+@not_memoized
 def random_strategy(self_hand, self_score, opp_score, opp_stands):
     """Random strategy (all actions are performed at random)
 
@@ -35,6 +174,7 @@ def random_strategy(self_hand, self_score, opp_score, opp_stands):
     return (play_card, card_index, stand)
 
 
+@not_memoized
 def blackjack_like_strategy(self_hand, self_score, opp_score, opp_stands):
     """Blackjack-like strategy (dealer draws to 16 stands on 17)
 
@@ -104,46 +244,53 @@ def blackjack_like_strategy(self_hand, self_score, opp_score, opp_stands):
     return (play_card, card_index, stand)
 
 
+@uses_model_file(MODEL_FILE_NAME, 'model_file_name')
 def ml_trainee_strategy(self_hand, self_score, opp_score, opp_stands,
                         enable_debug_output=False,
-                        model_file_name=MODEL_FILE_NAME):
+                        model_file_name=MODEL_FILE_NAME, regressor=None):
     """Plays using any model dumped in the result file of train_model
 
     Model can be created with computer_learn module.
     Predicts game outcomes of all possibilities, then choses the best one.
+    The model is loaded once per process, see model_cache module. Instead,
+    a fitted model may be passed in argument regressor.
+
+    Candidates are scored in order of card value, so that ties are broken
+    regardless of the order of the hand and memoized decisions (see
+    MemoizedStrategy) are the same.
     """
-    regressor = load(model_file_name)
+    import numpy as np
+    from features import get_transform
 
-    play_card, card_index, stand = False, 0, False
-    score_threshold = -10
+    if regressor is None:
+        regressor = load_model(model_file_name)
 
     # We extend the player's hand by 0. Playing a 0 is the same as not playing
-    # any card.
-    extended_hand = self_hand + [0]
-
-    for indx, card_val in enumerate(extended_hand):
-        for will_stand in [True, False]:
-            score = regressor.predict([[
-                self_score, opp_stands, will_stand,
-                self_score - opp_score, self_score + card_val
-            ]])[0]
-            if enable_debug_output:
-                print(f"Score for Self score: {self_score}, "
-                      f"Opp stands: {opp_stands}, Card: {card_val}, "
-                      f"Stand: {will_stand}: {score})")
-            # Using >= in the next line (rather than >) ensures that, in the
-            # case of equality, the last solution is selected, which means
-            # we prefer to not take any action.
-            if score >= score_threshold:
-                score_threshold = score
-                if card_val == 0:
-                    play_card, card_index, stand = False, 0, will_stand
-                else:
-                    play_card, card_index, stand = True, indx, will_stand
-
-    return (play_card, card_index, stand)
-
-
+    # any card. All candidate actions (every card, standing or not) are
+    # scored in a single predict call.
+    extended_hand = np.array(sorted(self_hand) + [0])
+    card_vals = np.repeat(extended_hand, 2)
+    stands = np.arange(len(card_vals)) % 2 == 0
+    scores = regressor.predict(get_transform(regressor).transform(
+        self_score, opp_score, opp_stands, card_vals, stands))
+
+    if enable_debug_output:
+        for card_val, will_stand, score in zip(card_vals, stands, scores):
+            print(f"Score for Self score: {self_score}, "
+                  f"Opp stands: {opp_stands}, Card: {card_val}, "
+                  f"Stand: {will_stand}: {score})")
+
+    # Searching the reversed scores ensures that, in the case of equality,
+    # the last candidate is selected, which means we prefer to not take any
+    # action.
+    best = len(scores) - 1 - int(np.argmax(scores[::-1]))
+    stand = bool(stands[best])
+    if card_vals[best] == 0:
+        return (False, 0, stand)
+    return (True, self_hand.index(int(card_vals[best])), stand)
+
+
+@uses_model_file(DECISION_TREE_DEFAULT_MODEL)
 def decision_tree_strategy(self_hand, self_score, opp_score, opp_stands,
                            enable_debug_output=False):
     """Plays using the decision tree dumped in the result file of
@@ -157,6 +304,7 @@ def decision_tree_strategy(self_hand, self_score, opp_score, opp_stands,
                                model_file_name=DECISION_TREE_DEFAULT_MODEL)
 
 
+@uses_model_file(RANDOM_FOREST_DEFAULT_MODEL)
 def random_forest_strategy(self_hand, self_score, opp_score, opp_stands,
                            enable_debug_output=False):
     """Plays using the random forest dumped in the result file of
@@ -168,3 +316,242 @@ def random_forest_strategy(self_hand, self_score, opp_score, opp_stands,
     return ml_trainee_strategy(self_hand, self_score, opp_score, opp_stands,
                                enable_debug_output=enable_debug_output,
                                model_file_name=RANDOM_FOREST_DEFAULT_MODEL)
+
+
+def load_policy(policy_file_name):
+    """Loads a policy table written by computer_learn.compile_model
+
+    Returns:
+        A tuple (table, min_score, min_card)
+    """
+    import numpy as np
+
+    with np.load(policy_file_name) as policy:
+        return (policy['table'], int(policy['min_score']),
+                int(policy['min_card']))
+
+
+@uses_model_file(POLICY_FILE_NAME, 'policy_file_name')
+def compiled_policy_strategy(self_hand, self_score, opp_score, opp_stands,
+                             policy_file_name=POLICY_FILE_NAME):
+    """Plays using a policy table compiled by computer_learn.compile_model
+
+    Makes the same decisions as ml_trainee_strategy using the compiled model,
+    but looks the scores up in the table rather than evaluating the model.
+    """
+    import numpy as np
+
+    table, min_score, min_card = load_model(policy_file_name,
+                                            loader=load_policy)
+    max_score = min_score + table.shape[0] - 1
+
+    # Scores for playing any card (or none), for standing and not standing
+    scores = table[min(max(self_score, min_score), max_score) - min_score,
+                   min(max(opp_score, min_score), max_score) - min_score,
+                   int(opp_stands)]
+    extended_hand = sorted(self_hand) + [0]
+    candidates = scores[np.array(extended_hand) - min_card, ::-1].ravel()
+
+    # As in ml_trainee_strategy, the last best candidate in order of card
+    # value is selected
+    best = len(candidates) - 1 - int(np.argmax(candidates[::-1]))
+    indx, stand = divmod(best, 2)
+    stand = not stand
+    if extended_hand[indx] == 0:
+        return (False, 0, stand)
+    return (True, self_hand.index(extended_hand[indx]), stand)
+
+
+@uses_model_file(DECISION_TREE_DEFAULT_POLICY)
+def compiled_decision_tree_strategy(self_hand, self_score, opp_score,
+                                    opp_stands):
+    """Plays using the policy compiled by computer_learn.compile_decision_tree
+    """
+    return compiled_policy_strategy(
+        self_hand, self_score, opp_score, opp_stands,
+        policy_file_name=DECISION_TREE_DEFAULT_POLICY)
+
+
+@uses_model_file(RANDOM_FOREST_DEFAULT_POLICY)
+def compiled_random_forest_strategy(self_hand, self_score, opp_score,
+                                    opp_stands):
+    """Plays using the policy compiled by computer_learn.compile_random_forest
+    """
+    return compiled_policy_strategy(
+        self_hand, self_score, opp_score, opp_stands,
+        policy_file_name=RANDOM_FOREST_DEFAULT_POLICY)
+
+
+def load_optimal_policy(table_file_name):
+    """Loads a decision table written by solver.Solver.save
+
+    Returns:
+        A dict containing the arrays of the table
+    """
+    import numpy as np
+
+    with np.load(table_file_name) as table:
+        return {key: table[key] for key in table.files}
+
+
+@uses_model_file(OPTIMAL_POLICY_FILE_NAME, 'table_file_name')
+def optimal_strategy(self_hand, self_score, opp_score, opp_stands,
+                     table_file_name=OPTIMAL_POLICY_FILE_NAME):
+    """Plays the action computed by the solver module
+
+    Looks the state up in the table written by solver.solve. The table
+    maximizes the outcome of the current set only, so cards are played
+    regardless of whether they'd be more valuable in later sets. It's
+    computed against a model of the opponent holding no side cards, so it
+    isn't optimal against opponents who play them. States not
+    covered by the table (e.g. hands containing unknown card values) are
+    played with the blackjack-like strategy.
+    """
+    import numpy as np
+
+    table = load_model(table_file_name, loader=load_optimal_policy)
+    card_values = table['card_values'].tolist()
+
+    code = 0
+    for val, max_count in zip(card_values, table['max_counts'].tolist()):
+        code = code * (max_count + 1) + self_hand.count(val)
+    hand_indx = int(np.searchsorted(table['hand_codes'], code))
+    drawn_indx = self_score - int(table['min_score']) - 1
+    decisions = table['decisions']
+
+    if (hand_indx == len(decisions) or table['hand_codes'][hand_indx] != code
+            or any(val not in card_values for val in self_hand)
+            or not 0 <= drawn_indx < decisions.shape[1]):
+        return blackjack_like_strategy(self_hand, self_score, opp_score,
+                                       opp_stands)
+
+    opp_indx = min(max(opp_score - int(table['min_score']), 0),
+                   decisions.shape[2] - 1)
+    card, stand = divmod(
+        int(decisions[hand_indx, drawn_indx, opp_indx, int(opp_stands)]), 2)
+    if card == 0:
+        return (False, 0, bool(stand))
+    return (True, self_hand.index(card_values[card - 1]), bool(stand))
+
+
+@not_memoized
+def monte_carlo_strategy(self_hand, self_score, opp_score, opp_stands,
+                         time_budget=MONTE_CARLO_TIME_BUDGET,
+                         max_rollouts=MONTE_CARLO_MAX_ROLLOUTS,
+                         batch_size=MONTE_CARLO_BATCH_SIZE,
+                         confidence=MONTE_CARLO_CONFIDENCE,
+                         opponent_strategy=blackjack_like_strategy,
+                         opponent_hand_size=HAND_SIZE,
+                         rollout_strategy=blackjack_like_strategy,
+                         seed=None):
+    """Evaluates every action by simulating the rest of the set
+
+    Every candidate action (play one of the cards or none, stand or not) is
+    evaluated by rollouts with the batch_simulator: the player continues
+    with rollout_strategy, the opponent with opponent_strategy and a hand
+    drawn at random from the side deck (her real hand is unknown). Rollouts
+    are played in rounds of batch_size per action. After each round, actions
+    whose upper confidence bound is below the best lower bound are dropped.
+    Sampling stops once a single action is left, the time budget is used up
+    or max_rollouts have been played per action.
+
+    Args:
+        time_budget: Time per decision in seconds
+        max_rollouts: Maximum number of rollouts per action
+        batch_size: Rollouts per action and round
+        confidence: z value of the confidence bounds
+        opponent_strategy: Strategy modeling the opponent. Rollouts are
+            simulated in batches, so this is blackjack_like_strategy,
+            random_strategy or a vectorized strategy, see
+            batch_simulator.vectorized. Others raise TypeError.
+        opponent_hand_size: Number of side cards the opponent is assumed to
+            hold
+        rollout_strategy: Strategy the player follows after this decision,
+            supported like opponent_strategy
+        seed: Seed of the random number generator. Default: None
+
+    Returns:
+        See random_strategy. Ties are resolved in favour of not playing a
+        card and not standing.
+    """
+    # Imported here, as batch_simulator depends on this module
+    import numpy as np
+    from batch_simulator import SetBatch, vectorized
+    from pazaak_player import ComputerPlayer
+
+    start = timer()
+    rng = np.random.default_rng(seed)
+    strategies = (vectorized(rollout_strategy), vectorized(opponent_strategy))
+    side_deck = np.array(ComputerPlayer.side_deck)
+
+    # Candidates: (card index or None, stand); one per distinct card value
+    card_indices = [None] + [self_hand.index(val)
+                             for val in sorted(set(self_hand))]
+    candidates = [(indx, stand) for indx in card_indices
+                  for stand in (False, True)]
+    scores = np.array([self_score + (0 if indx is None else self_hand[indx])
+                       for indx, _ in candidates])
+    hands = np.zeros((len(candidates), max(HAND_SIZE, len(self_hand))),
+                     dtype=np.int64)
+    for row, (indx, _) in enumerate(candidates):
+        remaining = [val for pos, val in enumerate(self_hand) if pos != indx]
+        hands[row, :len(remaining)] = remaining
+    stands = np.array([stand for _, stand in candidates]) \
+        | (scores > SCORE_GOAL)
+
+    totals = np.zeros(len(candidates))
+    squares = np.zeros(len(candidates))
+    counts = np.zeros(len(candidates))
+    # Actions busting the player lose for sure and aren't simulated
+    active = np.nonzero(scores <= SCORE_GOAL)[0]
+
+    while len(active) > 1:
+        rows = np.repeat(active, batch_size)
+        opp_hands = np.zeros((len(rows), hands.shape[1]), dtype=np.int64)
+        if opponent_hand_size:
+            order = rng.random((len(rows), len(side_deck))).argsort(axis=1)
+            opp_hands[:, :opponent_hand_size] = \
+                side_deck[order[:, :opponent_hand_size]]
+        batch = SetBatch(np.stack([hands[rows], opp_hands], axis=1),
+                         np.stack([scores[rows],
+                                   np.full(len(rows), opp_score)], axis=1),
+                         np.stack([stands[rows],
+                                   np.full(len(rows), opp_stands)], axis=1),
+                         np.ones(len(rows)))
+        outcomes = batch.play(strategies, rng)
+        np.add.at(totals, rows, outcomes)
+        np.add.at(squares, rows, outcomes ** 2)
+        counts[active] += batch_size
+
+        means = totals[active] / counts[active]
+        variances = np.maximum(squares[active] / counts[active] - means ** 2,
+                               0)
+        stderr = np.sqrt(variances / counts[active])
+        lower, upper = means - confidence * stderr, means + confidence * stderr
+        active = active[upper >= lower.max()]
+        if (timer() - start > time_budget
+                or counts[active[0]] >= max_rollouts):
+            break
+
+    if not len(active):
+        # Every action busts
+        active = np.arange(len(candidates))
+    means = totals[active] / np.maximum(counts[active], 1)
+    best = active[int(np.argmax(means))]
+    card_index, stand = candidates[best]
+    if card_index is None:
+        return (False, 0, stand)
+    return (True, card_index, stand)
+
+
+# Strategies by name, e.g. for command line options
+STRATEGIES = {
+    'random': random_strategy,
+    'blackjack': blackjack_like_strategy,
+    'decision_tree': decision_tree_strategy,
+    'random_forest': random_forest_strategy,
+    'compiled_decision_tree': compiled_decision_tree_strategy,
+    'compiled_random_forest': compiled_random_forest_strategy,
+    'optimal': optimal_strategy,
+    'monte_carlo': monte_carlo_strategy,
+}
@@ -0,0 +1,65 @@
+"""Growable columnar buffer used to record datasets"""
+
+import numpy as np
+
+
+class ColumnarBuffer:
+    """Append-only table storing each column in a typed NumPy array
+
+    Appending a row writes into preallocated arrays, which double in size
+    once they're full. Columns are read as views of the arrays, see column.
+
+    Args:
+        columns: List of tuples (column name, numpy dtype)
+        capacity: Number of rows to preallocate
+    """
+
+    def __init__(self, columns, capacity=1024):
+        self.names = [name for name, _ in columns]
+        self.dtypes = [np.dtype(dtype) for _, dtype in columns]
+        self._arrays = [np.empty(capacity, dtype) for dtype in self.dtypes]
+        self._capacity = capacity
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        """Memory allocated for the columns, in bytes
+
+        This includes the capacity not used yet, so it's what recording the
+        rows actually costs.
+        """
+        return sum(array.nbytes for array in self._arrays)
+
+    def append(self, *values):
+        """Appends a row
+
+        Args:
+            values: Row values, in the order of the columns
+        """
+        if self._size == self._capacity:
+            self._grow()
+        indx = self._size
+        for array, value in zip(self._arrays, values):
+            array[indx] = value
+        self._size += 1
+
+    def _grow(self):
+        self._capacity *= 2
+        for indx, array in enumerate(self._arrays):
+            grown = np.empty(self._capacity, array.dtype)
+            grown[:self._size] = array[:self._size]
+            self._arrays[indx] = grown
+
+    def column(self, name):
+        """Returns a view of the recorded values of a column
+
+        Writing to the view modifies the buffer.
+        """
+        return self._arrays[self.names.index(name)][:self._size]
+
+    def clear(self):
+        """Removes all rows, keeping the allocated memory"""
+        self._size = 0
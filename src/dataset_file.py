@@ -0,0 +1,154 @@
+"""Compact binary file format for datasets, loaded by memory mapping
+
+A dataset file starts with a fixed-size header: the MAGIC bytes followed by
+a JSON document, padded with spaces to HEADER_SIZE bytes. It describes the
+number of rows, every column (name, NumPy dtype and offset in the file) and
+the reward scheme the scores were labeled with, if any. The columns follow
+the header, each one stored contiguously and aligned to ALIGNMENT bytes.
+
+Columns are read with np.memmap, so opening a dataset doesn't parse (or
+even read) any data. As the header has a fixed size, it can be rewritten in
+place, e.g. when relabeling the scores.
+"""
+
+import json
+
+import numpy as np
+
+MAGIC = b'PZKDATA1'
+HEADER_SIZE = 1024
+ALIGNMENT = 64
+VERSION = 1
+
+
+def is_dataset_file(file_name):
+    """Whether a file is a binary dataset (rather than e.g. a csv file)"""
+    with open(file_name, 'rb') as dataset_file:
+        return dataset_file.read(len(MAGIC)) == MAGIC
+
+
+def write_dataset(file_name, columns, rewards=None):
+    """Writes columns to a binary dataset file
+
+    Args:
+        file_name: The file to write
+        columns: Mapping of column names to arrays (e.g. a DataFrame), all of
+            the same length. Their dtypes are kept.
+        rewards: dict describing the reward scheme of the score column, e.g.
+            {'final': 1., 'other': .3}. Default: None (unlabeled)
+    """
+    arrays = {name: np.ascontiguousarray(columns[name]) for name in columns}
+    n_rows = len(next(iter(arrays.values()))) if arrays else 0
+    for name, array in arrays.items():
+        if len(array) != n_rows:
+            raise ValueError(f"Column {name} has {len(array)} rows, "
+                             f"expected {n_rows}")
+
+    header, size = _layout([(name, array.dtype.str)
+                            for name, array in arrays.items()],
+                           n_rows, rewards)
+    with open(file_name, 'wb') as dataset_file:
+        dataset_file.write(_encode_header(header))
+        for spec, array in zip(header['columns'], arrays.values()):
+            dataset_file.seek(spec['offset'])
+            dataset_file.write(array.tobytes())
+        dataset_file.truncate(size)
+
+
+def concatenate_datasets(file_names, file_name):
+    """Concatenates the rows of binary dataset files having the same columns,
+    copying one column of one file at a time
+
+    Args:
+        file_names: Files to concatenate, at least one
+        file_name: The file to write. Takes the reward scheme of the first
+            file.
+    """
+    if not file_names:
+        raise ValueError("No datasets to concatenate")
+    headers = [read_header(part_name) for part_name in file_names]
+    columns = [(spec['name'], spec['dtype'])
+               for spec in headers[0]['columns']]
+    if any([(spec['name'], spec['dtype']) for spec in header['columns']]
+           != columns for header in headers):
+        raise ValueError("Datasets have different columns")
+
+    header, size = _layout(columns, sum(part['rows'] for part in headers),
+                           headers[0]['rewards'])
+    with open(file_name, 'wb') as dataset_file:
+        dataset_file.write(_encode_header(header))
+        for spec in header['columns']:
+            dataset_file.seek(spec['offset'])
+            for part_name in file_names:
+                dataset_file.write(
+                    np.ascontiguousarray(open_dataset(part_name)[1][
+                        spec['name']]).tobytes())
+        dataset_file.truncate(size)
+
+
+def read_header(file_name):
+    """Reads the header of a binary dataset file
+
+    Returns:
+        dict containing version, rows, columns and rewards
+    """
+    with open(file_name, 'rb') as dataset_file:
+        raw = dataset_file.read(HEADER_SIZE)
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{file_name} is not a dataset file")
+    header = json.loads(raw[len(MAGIC):].decode())
+    if header['version'] != VERSION:
+        raise ValueError(f"Unsupported dataset file version "
+                         f"{header['version']}")
+    return header
+
+
+def write_header(file_name, header):
+    """Rewrites the header of a binary dataset file in place"""
+    with open(file_name, 'r+b') as dataset_file:
+        dataset_file.write(_encode_header(header))
+
+
+def open_dataset(file_name, mode='r'):
+    """Memory maps the columns of a binary dataset file
+
+    Args:
+        file_name: The file to open
+        mode: 'r' for read-only columns, 'r+' to modify them in place
+
+    Returns:
+        A tuple (header, columns), columns being a dict mapping column names
+        to memory mapped arrays
+    """
+    header = read_header(file_name)
+    columns = {}
+    for spec in header['columns']:
+        if header['rows']:
+            columns[spec['name']] = np.memmap(
+                file_name, np.dtype(spec['dtype']), mode, spec['offset'],
+                (header['rows'],))
+        else:
+            # Empty files can't be memory mapped
+            columns[spec['name']] = np.empty(0, np.dtype(spec['dtype']))
+    return header, columns
+
+
+def _layout(columns, n_rows, rewards):
+    """Header of a dataset with columns given as (name, dtype) and the file
+    size
+    """
+    offset, specs = HEADER_SIZE, []
+    for name, dtype in columns:
+        specs.append({'name': name, 'dtype': np.dtype(dtype).str,
+                      'offset': offset})
+        offset += -(-n_rows * np.dtype(dtype).itemsize // ALIGNMENT) \
+            * ALIGNMENT
+    return {'version': VERSION, 'rows': n_rows, 'columns': specs,
+            'rewards': rewards}, offset
+
+
+def _encode_header(header):
+    encoded = MAGIC + json.dumps(header).encode()
+    if len(encoded) > HEADER_SIZE:
+        raise ValueError("Dataset header too large")
+    return encoded.ljust(HEADER_SIZE)
@@ -0,0 +1,149 @@
+"""Game events and sinks consuming them
+
+The game engine doesn't print anything itself. Instead, it emits events to
+a sink: the ConsoleSink prints them for humans, the NullSink drops them
+(without even creating the event) and the RecordingSink collects them.
+
+Engine code calls sink.emit(EventType, *fields). Lists among the fields
+(boards) may be modified later on, so sinks keeping events have to copy
+them.
+"""
+
+from collections import namedtuple
+
+
+def _status(board):
+    return f"Board: {list(board)}. Score: {sum(board)}."
+
+
+class TurnStarted(namedtuple('TurnStarted', 'player')):
+    """A player's turn starts"""
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.player}'s turn."
+
+
+class CardDrawn(namedtuple('CardDrawn', 'player card board')):
+    """A player drew a neutral card"""
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.player} drew a {self.card}. {_status(self.board)}"
+
+
+class CardPlayed(namedtuple('CardPlayed', 'player card board index')):
+    """A player played the card at index of her hand"""
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.player} plays a {self.card}. {_status(self.board)}"
+
+
+class Standing(namedtuple('Standing', 'player board')):
+    """A player who stands already skips her turn"""
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.player} stands. {_status(self.board)}"
+
+
+class Stood(namedtuple('Stood', 'player')):
+    """A player decided to stand"""
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.player} stands."
+
+
+class Busted(namedtuple('Busted', 'player stand')):
+    """A player busted. stand tells whether she had decided to stand as
+    well.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.player} busted."
+
+
+class SetOver(namedtuple('SetOver', 'player player_score '
+                                    'opponent opponent_score')):
+    """A set is over"""
+    __slots__ = ()
+
+    def __str__(self):
+        return (f"Set over. {self.player}'s score: {self.player_score}, "
+                f"{self.opponent}'s score: {self.opponent_score}")
+
+
+class SetWon(namedtuple('SetWon', 'player')):
+    """A player won the set"""
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.player} wins the set."
+
+
+class SetDrawn(namedtuple('SetDrawn', '')):
+    """A set ended with a draw"""
+    __slots__ = ()
+
+    def __str__(self):
+        return "Set ends with a draw."
+
+
+class SetsWon(namedtuple('SetsWon', 'player player_sets '
+                                    'opponent opponent_sets')):
+    """Number of sets won by either player"""
+    __slots__ = ()
+
+    def __str__(self):
+        return (f"Sets won: {self.player}: {self.player_sets}, "
+                f"{self.opponent}: {self.opponent_sets}.")
+
+
+class GameOver(namedtuple('GameOver', 'winner')):
+    """The game is over. The winner is None for a draw, which only happens
+    in games of a single set.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        if self.winner is None:
+            return "Game over. It's a draw."
+        return f"Game over. {self.winner} won. Congratulations!"
+
+
+class NullSink:
+    """Drops all events. Used in simulations."""
+
+    def emit(self, event_type, *fields):
+        """Drops the event"""
+
+
+class ConsoleSink:
+    """Prints all events on the console"""
+
+    def emit(self, event_type, *fields):
+        """Prints the event"""
+        print(event_type(*fields))
+
+
+class RecordingSink:
+    """Collects all events in the events list"""
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event_type, *fields):
+        """Records the event, copying boards"""
+        self.events.append(event_type(*(
+            tuple(field) if isinstance(field, list) else field
+            for field in fields)))
+
+    def clear(self):
+        """Removes all recorded events"""
+        self.events.clear()
+
+
+CONSOLE = ConsoleSink()
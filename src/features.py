@@ -0,0 +1,80 @@
+"""Features the models are trained on and decide with
+
+A FeatureTransform computes the features of decisions from the state they
+were made in and the action taken, on batches of NumPy arrays. Training
+(see computer_learn.load_dataset) and play (see ml_trainee_strategy and
+computer_learn.compile_model) use the same transform: it's stored with the
+fitted model, in attribute TRANSFORM_ATTRIBUTE, and dumped along with it.
+A model is thus always fed the features it was trained on. Models dumped
+without a transform use the default FeatureTransform.
+"""
+
+import numpy as np
+
+TRANSFORM_ATTRIBUTE = 'feature_transform_'
+
+
+class FeatureTransform:
+    """Computes the features of decisions
+
+    A minimum amount of feature engineering: The player's and opponent's
+    exact score may not be that important for our decisions. The difference,
+    however, certainly is. Moreover, the card value itself is not that
+    important. Here, the sum is.
+
+    Attributes:
+        names: Names of the features, in the order of the feature columns
+    """
+
+    names = ('self_score', 'opp_stands', 'result_stand', 'score_difference',
+             'score_if_card_played')
+
+    def transform(self, self_score, opp_score, opp_stands, card_val, stand):
+        """Computes the features of a batch of decisions
+
+        Arguments are arrays (or scalars) broadcast against each other, so
+        all candidate actions in a single state are transformed by passing
+        the scores as scalars and the actions as arrays.
+
+        Args:
+            self_score: The player's score before the action
+            opp_score: The opponent's score
+            opp_stands: Whether the opponent stands
+            card_val: Value of the card played, 0 if none
+            stand: Whether the player stands
+
+        Returns:
+            int16 array with one row per decision and one column per feature
+        """
+        shape = np.broadcast(self_score, opp_score, opp_stands, card_val,
+                             stand).shape
+        features = np.empty(shape + (len(self.names),), np.int16)
+        # Assigning casts the inputs, e.g. the floats of csv datasets
+        features[..., 0] = self_score
+        features[..., 1] = opp_stands
+        features[..., 2] = stand
+        features[..., 3] = opp_score
+        features[..., 4] = card_val
+        np.subtract(features[..., 0], features[..., 3], out=features[..., 3])
+        np.add(features[..., 0], features[..., 4], out=features[..., 4])
+        return features.reshape(-1, len(self.names))
+
+
+def get_transform(regressor):
+    """The feature transform stored with a model, see set_transform"""
+    return getattr(regressor, TRANSFORM_ATTRIBUTE, _default_transform)
+
+
+def set_transform(regressor, transform=None):
+    """Stores a feature transform with a model, to be dumped along with it
+
+    Args:
+        regressor: The model
+        transform: The transform the model is trained with. Default: None
+            (the default FeatureTransform)
+    """
+    setattr(regressor, TRANSFORM_ATTRIBUTE,
+            _default_transform if transform is None else transform)
+
+
+_default_transform = FeatureTransform()
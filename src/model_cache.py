@@ -0,0 +1,142 @@
+"""Process-wide cache for models dumped by computer_learn.train_model
+
+Loading a model with joblib deserializes the whole file, which is far too
+expensive to do on every decision. Models are cached by path and reloaded
+only if the file on disk changes (different mtime or size). The file is
+checked at most once every MODEL_CACHE_CHECK_INTERVAL seconds, so repeated
+decisions don't touch the filesystem at all.
+"""
+
+import os
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+from pazaak_constants import MODEL_CACHE_SIZE, MODEL_CACHE_CHECK_INTERVAL
+
+
+class ModelCache:
+    """Bounded LRU cache of loaded models
+
+    Args:
+        max_size: Maximum number of models kept in memory. The least recently
+            used model is evicted once the cache is full.
+        check_interval: Minimum time in seconds between two checks whether
+            a cached model file has changed on disk
+    """
+
+    def __init__(self, max_size=MODEL_CACHE_SIZE,
+                 check_interval=MODEL_CACHE_CHECK_INTERVAL):
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self._models = OrderedDict()
+        self._signatures = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_time = 0.
+
+    def get(self, model_file_name, loader=None):
+        """Returns the model dumped in model_file_name, loading it if needed
+
+        Args:
+            model_file_name: joblib dump of the model
+            loader: Function loading the file. Default: joblib.load
+
+        Returns:
+            The loaded model
+        """
+        now = timer()
+        entry = self._models.get(model_file_name)
+        if entry is not None and now - entry[2] < self.check_interval:
+            self.hits += 1
+            self._models.move_to_end(model_file_name)
+            return entry[1]
+
+        stat = os.stat(model_file_name)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if entry is not None and entry[0] == signature:
+            self.hits += 1
+            self._models[model_file_name] = (signature, entry[1], now)
+            self._models.move_to_end(model_file_name)
+            return entry[1]
+
+        self.misses += 1
+        if loader is None:
+            # joblib (and with it, sklearn) is only imported when needed
+            from joblib import load as loader
+        model = loader(model_file_name)
+        self.load_time += timer() - now
+
+        self._models[model_file_name] = (signature, model, now)
+        self._models.move_to_end(model_file_name)
+        while len(self._models) > self.max_size:
+            self._models.popitem(last=False)
+            self.evictions += 1
+        return model
+
+    def signature(self, model_file_name):
+        """Signature of a model file (mtime and size), changing whenever the
+        file does. Like get, the file is checked at most once every
+        check_interval seconds.
+        """
+        now = timer()
+        entry = self._signatures.get(model_file_name)
+        if entry is not None and now - entry[1] < self.check_interval:
+            return entry[0]
+        stat = os.stat(model_file_name)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        self._signatures[model_file_name] = (signature, now)
+        return signature
+
+    def clear(self):
+        """Removes all models from the cache and resets the counters"""
+        self._models.clear()
+        self._signatures.clear()
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self.load_time = 0.
+
+    def stats(self):
+        """Cache statistics
+
+        Returns:
+            dict containing hits, misses, evictions, number of cached models
+            and total time spent loading models (in seconds)
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._models),
+            'load_time': self.load_time,
+        }
+
+
+_cache = ModelCache()
+
+
+def load_model(model_file_name, loader=None):
+    """Loads a model through the process-wide cache
+
+    Args:
+        model_file_name: joblib dump of the model
+        loader: Function loading the file. Default: joblib.load
+
+    Returns:
+        The loaded model
+    """
+    return _cache.get(model_file_name, loader)
+
+
+def model_signature(model_file_name):
+    """Signature of a model file, see ModelCache.signature"""
+    return _cache.signature(model_file_name)
+
+
+def cache_stats():
+    """Statistics of the process-wide model cache, see ModelCache.stats"""
+    return _cache.stats()
+
+
+def clear_cache():
+    """Clears the process-wide model cache"""
+    _cache.clear()
@@ -0,0 +1,113 @@
+"""Paired evaluation of strategies on common random numbers
+
+Every candidate strategy plays the same games against the same opponent:
+game i is played with seed i of a common seed stream, so the candidate's
+seat is dealt the same hand and the same neutral cards for every candidate
+(see pazaak.GameSession.play_seeded_game). Differences in win rates are then
+estimated from the per-game differences, which vary far less than the
+results of independent games. The same statistical power needs fewer
+games.
+"""
+
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import pazaak
+from pazaak_player import AbstractPlayer as Player
+from computer_strategies import blackjack_like_strategy
+from events import NullSink
+
+
+def game_seeds(n_games, seed=None):
+    """Seed stream of the games, derived from a master seed
+
+    Returns:
+        List of n_games seeds
+    """
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    seed_rng = random.Random(seed)
+    return [seed_rng.getrandbits(64) for _ in range(n_games)]
+
+
+def play_seeded_games(strategy_func, opponent_strategy, seeds):
+    """Plays one game per seed
+
+    Args:
+        strategy_func: Strategy of the player
+        opponent_strategy: Strategy of the opponent
+        seeds: Seeds of the games, see game_seeds
+
+    Returns:
+        Array containing 1 for every game won by the player, else 0
+    """
+    session = pazaak.GameSession(
+        Player.create_computer("Player", strategy_func),
+        Player.create_computer("Opponent", opponent_strategy),
+        events=NullSink())
+    outcomes = np.zeros(len(seeds), np.int8)
+    for indx, game_seed in enumerate(seeds):
+        # Strategies may use the random module as well
+        random.seed(game_seed)
+        outcomes[indx] = session.play_seeded_game(game_seed) is session.player
+    return outcomes
+
+
+def compare_strategies(strategies, opponent_strategy=blackjack_like_strategy,
+                       n_games=1000, seed=None, baseline=None, z_value=1.96,
+                       use_processes=True):
+    """Compares strategies against a baseline on common random numbers
+
+    Args:
+        strategies: dict mapping names to strategy functions. They have to be
+            picklable if use_processes is set.
+        opponent_strategy: Strategy all candidates play against. Default:
+            blackjack_like_strategy
+        n_games: Number of games per strategy. Default: 1000
+        seed: Master seed of the games. Default: None (random seed)
+        baseline: Name of the strategy the others are compared with.
+            Default: the first one
+        z_value: z value of the confidence intervals. Default: 1.96
+        use_processes: Whether to play every strategy in its own process
+
+    Returns:
+        DataFrame with one row per strategy: win_rate, difference of win
+        rates to the baseline with the bounds of its confidence interval
+        (diff, diff_low, diff_high) and games_factor, the factor of games an
+        unpaired comparison would need for the same interval
+    """
+    names = list(strategies)
+    if baseline is None:
+        baseline = names[0]
+    seeds = game_seeds(n_games, seed)
+    args = ([strategies[name] for name in names],
+            [opponent_strategy] * len(names), [seeds] * len(names))
+    if use_processes:
+        with ProcessPoolExecutor(max_workers=len(names)) as executor:
+            outcomes = dict(zip(names, executor.map(play_seeded_games,
+                                                    *args)))
+    else:
+        outcomes = dict(zip(names, map(play_seeded_games, *args)))
+
+    base = outcomes[baseline].astype(float)
+    rows = []
+    for name in names:
+        wins = outcomes[name].astype(float)
+        diff = wins - base
+        paired_err = diff.std(ddof=1) / math.sqrt(n_games)
+        unpaired_err = math.sqrt((wins.var(ddof=1) + base.var(ddof=1))
+                                 / n_games)
+        rows.append({
+            'strategy': name,
+            'win_rate': wins.mean(),
+            'diff': diff.mean(),
+            'diff_low': diff.mean() - z_value * paired_err,
+            'diff_high': diff.mean() + z_value * paired_err,
+            'games_factor': (unpaired_err / paired_err) ** 2
+                            if paired_err else float('nan'),
+        })
+    return pd.DataFrame(rows)
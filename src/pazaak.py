@@ -1,170 +1,493 @@
 """A simple implementation of KotOR's blackjack-inspired minigame"""
 
+import argparse
+import copy
+import os
 import random
 import time
 import functools
+from timeit import default_timer as timer
 
 from pazaak_player import AbstractPlayer as Player
-from pazaak_constants import SCORE_GOAL, SLEEP_TIME, \
-    WINNING_SETS, REQUIRE_INPUT_AFTER_SET
-from computer_strategies import decision_tree_strategy, random_forest_strategy
+from pazaak_constants import SCORE_GOAL, SLEEP_TIME, HAND_SIZE, \
+    WINNING_SETS, REQUIRE_INPUT_AFTER_SET, SPRT_ALPHA, SPRT_BETA, \
+    SPRT_EFFECT, OPTIMAL_POLICY_FILE_NAME, DECISION_TREE_DEFAULT_MODEL, \
+    RANDOM_FOREST_DEFAULT_MODEL, DECISION_TREE_DEFAULT_POLICY, \
+    RANDOM_FOREST_DEFAULT_POLICY
+from computer_strategies import decision_tree_strategy, \
+    random_forest_strategy, STRATEGIES
+from events import CONSOLE, NullSink, SetOver, SetWon, SetDrawn, SetsWon, \
+    GameOver
+from sequential import SPRT, SequentialResult, INCONCLUSIVE
 
 DEBUG_STRATEGY = functools.partial(decision_tree_strategy,
                                    enable_debug_output=True)
-# Change player config here!
+# Default players. Run with --help to choose others.
 player = Player.create_human("Alice")
 opponent = Player.create_computer("Bob", strategy_func=random_forest_strategy)
+# How to create the files the computer strategies read
+MODEL_FILE_COMMANDS = {
+    OPTIMAL_POLICY_FILE_NAME: "python solver.py",
+    DECISION_TREE_DEFAULT_MODEL: "computer_learn.train_decision_tree()",
+    RANDOM_FOREST_DEFAULT_MODEL: "computer_learn.train_random_forest()",
+    DECISION_TREE_DEFAULT_POLICY: "computer_learn.compile_decision_tree()",
+    RANDOM_FOREST_DEFAULT_POLICY: "computer_learn.compile_random_forest()",
+}
 
 
-def set_is_over():
-    """Determines whether a set is over
+class GameSession:
+    """A game of pazaak between two players
 
-    Returns:
-        True is set is over (both players either busted or stand), else False
+    A session owns its players, its random number generator and its rules,
+    so that several sessions can be played independently in one process.
+
+    Args:
+        player: First player
+        opponent: Second player
+        rng: Random number generator used to draw cards and to choose the
+            starting player, e.g. random.Random(seed). Default: A new,
+            unseeded random.Random instance
+        score_goal: Score to reach without busting. Default: SCORE_GOAL
+        winning_sets: Sets needed to win the game. Default: WINNING_SETS
+        hand_size: Cards drawn from the side deck. Default: HAND_SIZE
+        events: Sink receiving the game events, see events module.
+            Default: CONSOLE (prints them)
     """
-    return(
-        player.get_score() > SCORE_GOAL
-        or opponent.get_score() > SCORE_GOAL
-        or (player.stands and opponent.stands))
 
+    def __init__(self, player, opponent, rng=None, score_goal=SCORE_GOAL,
+                 winning_sets=WINNING_SETS, hand_size=HAND_SIZE,
+                 events=CONSOLE):
+        self.player = player
+        self.opponent = opponent
+        self.rng = random.Random() if rng is None else rng
+        self.score_goal = score_goal
+        self.winning_sets = winning_sets
+        self.hand_size = hand_size
+        self.sets_drawn = 0
+        self.events = events
+        for each_player in (player, opponent):
+            each_player.rng = self.rng
+            each_player.score_goal = score_goal
+            each_player.hand_size = hand_size
+            each_player.events = events
+
+    def set_is_over(self):
+        """Determines whether a set is over
+
+        Returns:
+            True is set is over (both players either busted or stand), else
+            False
+        """
+        return(
+            self.player.get_score() > self.score_goal
+            or self.opponent.get_score() > self.score_goal
+            or (self.player.stands and self.opponent.stands))
+
+    def game_is_over(self):
+        """Determine whether the game is over
+
+        Returns:
+            True if game is over (a player has won enough sets), else False
+        """
+        return self.winning_sets in (self.player.sets_won,
+                                     self.opponent.sets_won)
+
+    def get_winner(self):
+        """Determine the winner of the game
+
+        Returns:
+            The winning player, or None if game isn't over yet
+        """
+        if self.player.sets_won == self.winning_sets:
+            return self.player
+        if self.opponent.sets_won == self.winning_sets:
+            return self.opponent
+        return None
+
+    def setup_game(self):
+        """Sets up the geame"""
+        self.player.draw_hand()
+        self.opponent.draw_hand()
+
+    def determine_winner(self):
+        """Determine the winner of the set
+
+        Returns:
+            The winning player
+        """
+        player_score = self.player.get_score()
+        opponent_score = self.opponent.get_score()
+        self.events.emit(SetOver, self.player.name, player_score,
+                         self.opponent.name, opponent_score)
+
+        if player_score > self.score_goal:
+            return self.opponent.win_set()
+        if opponent_score > self.score_goal:
+            return self.player.win_set()
+        if opponent_score > player_score:
+            return self.opponent.win_set()
+        if opponent_score < player_score:
+            return self.player.win_set()
+        self.sets_drawn += 1
+        return None
+
+    def prepare_next_set(self):
+        """Cleanup boards and prepare for for next set"""
+        self.player.stands, self.opponent.stands = False, False
+        self.player.clear_board()
+        self.opponent.clear_board()
+
+    def prepare_next_game(self):
+        """Cleanup board and players to prepare next game"""
+        self.prepare_next_set()
+        self.player.sets_won, self.opponent.sets_won = 0, 0
+        self.player.draw_hand()
+        self.opponent.draw_hand()
+
+    def play_a_set(self, active_player, inactive_player,
+                   sleep_time=SLEEP_TIME):
+        """Plays a single set of Pazaak
+
+        Args:
+            active_player: First player to take a turn
+            inactive_player: Her opponent
+            sleep_time: Time to elapse between turns in seconds
+
+        Returns:
+            The winning player
+        """
+        while not self.set_is_over():
+            active_player.take_turn(inactive_player)
+            # Even time.sleep(0) costs a system call per turn
+            if sleep_time:
+                time.sleep(sleep_time)
+            active_player, inactive_player = inactive_player, active_player
+        return self.determine_winner()
+
+    def play_a_game(self, require_input_after_set=REQUIRE_INPUT_AFTER_SET,
+                    sleep_time=SLEEP_TIME):
+        """Plays a single game of Pazaak
+
+        Args:
+            require_input_after_set: Requires user input after set is over in
+                order to suspend game progress
+
+        Returns:
+            The winning player
+        """
+        player, opponent = self.player, self.opponent
+        self.setup_game()
+        active_player, inactive_player = self.rng.sample([player, opponent], 2)
+        while not self.game_is_over():
+            winner = self.play_a_set(active_player, inactive_player,
+                                     sleep_time)
+            if winner is not None:
+                self.events.emit(SetWon, winner.name)
+                # Winner starts next set
+                if winner is not active_player:
+                    active_player, inactive_player = \
+                        inactive_player, active_player
+            else:
+                self.events.emit(SetDrawn)
+
+            if require_input_after_set:
+                input(f"Sets won: {player.name}: {player.sets_won}, "
+                      f"{opponent.name}: {opponent.sets_won}.")
+            else:
+                self.events.emit(SetsWon, player.name, player.sets_won,
+                                 opponent.name, opponent.sets_won)
+            self.prepare_next_set()
+        self.events.emit(GameOver, self.get_winner().name)
+        return self.get_winner()
+
+    def play_n_games(self, n_games=1000):
+        """Plays n games of pazaak
+
+        Args:
+            n_games: The number of games to play; default 1000
+
+        Returns:
+            games_won: The number of games won by the player
+        """
+        games_won = 0
+        for _ in range(0, n_games):
+            if self.play_a_game(False, 0) is self.player:
+                games_won += 1
+            self.prepare_next_game()
+        return games_won
+
+    def play_seeded_game(self, game_seed):
+        """Plays a game whose cards only depend on game_seed
+
+        Either player draws her hand and neutral cards from a generator of
+        her own, seeded from game_seed and her seat. The session's generator
+        (choosing the starting player) is seeded from game_seed as well. So a
+        seat is dealt the same cards, no matter how the players decide,
+        which allows to compare strategies on common random numbers.
+
+        Args:
+            game_seed: Seed of the game, a non-negative integer
+
+        Returns:
+            The winning player
+        """
+        self.rng.seed(game_seed * 3)
+        for seat, each_player in enumerate((self.player, self.opponent), 1):
+            if each_player.rng is self.rng:
+                each_player.rng = random.Random()
+            each_player.rng.seed(game_seed * 3 + seat)
+        winner = self.play_a_game(False, 0)
+        self.prepare_next_game()
+        return winner
+
+    def play_until_decided(self, baseline=.5, effect=SPRT_EFFECT,
+                           alpha=SPRT_ALPHA, beta=SPRT_BETA, max_games=1000):
+        """Plays games until a sequential test decides whether the player's
+        win rate is above or below baseline, see sequential.SPRT
+
+        Args:
+            baseline: Win rate to compare with. Default: .5
+            effect: Distance of the hypotheses to the baseline
+            alpha: Probability to decide 'better' if the win rate is
+                baseline - effect
+            beta: Probability to decide 'worse' if the win rate is
+                baseline + effect
+            max_games: Maximum number of games. Default: 1000
+
+        Returns:
+            SequentialResult of the games played
+        """
+        test = SPRT(baseline, effect, alpha, beta)
+        decision = None
+        while decision is None and test.games < max_games:
+            decision = test.update(self.play_a_game(False, 0) is self.player)
+            self.prepare_next_game()
+        return SequentialResult(decision or INCONCLUSIVE, test.games,
+                                test.games_won, test.llr)
+
+    def play_n_games_parallel(self, n_games=1000, workers=None, seed=None,
+                              use_processes=True):
+        """Plays n games of pazaak, distributed over a pool of processes
+
+        The games are split into one shard per worker. Each shard is played
+        by a copy of this session, seeded with a seed derived from the master
+        seed. For a fixed seed and number of workers, the results are
+        therefore identical, no matter whether the shards are played in
+        parallel or one after another. Strategy functions have to be
+        picklable (e.g. module level functions or functools.partial). Note
+        that the random module is reseeded for every shard, as strategies may
+        use it.
+
+        Args:
+            n_games: The number of games to play; default 1000
+            workers: The number of shards (and processes). Default: number
+                of CPUs
+            seed: Master seed. Default: None (random seed)
+            use_processes: Whether to play the shards in a process pool. If
+                False, they're played one after another in this process.
+
+        Returns:
+            GameResults of all games played
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        seed_rng = random.Random(seed)
+        shards = [(self.player, self.opponent,
+                   (self.score_goal, self.winning_sets, self.hand_size),
+                   n_games // workers + (indx < n_games % workers),
+                   (seed_rng.getrandbits(64), seed_rng.getrandbits(64)))
+                  for indx in range(workers)]
+
+        start = timer()
+        if use_processes and workers > 1:
+            # Imported here, as it slows down the start of interactive games
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                shard_results = list(executor.map(_play_shard, shards))
+        else:
+            shard_results = [_play_shard(shard) for shard in shards]
 
-def game_is_over():
-    """Determine whether the game is over
+        results = sum(shard_results, GameResults())
+        results.seed = seed
+        results.duration = timer() - start
+        return results
 
-    Returns:
-        True if game is over (a player has won enough sets), else False
+
+class GameResults:
+    """Results of games played, from the point of view of the session's player
+
+    Results of different shards can be merged by adding them.
     """
-    return WINNING_SETS in (player.sets_won, opponent.sets_won)
 
+    def __init__(self, games_won=0, games_lost=0, sets_won=0, sets_lost=0,
+                 sets_drawn=0):
+        self.games_won = games_won
+        self.games_lost = games_lost
+        self.sets_won = sets_won
+        self.sets_lost = sets_lost
+        self.sets_drawn = sets_drawn
+        self.seed = None
+        self.duration = 0.
+
+    def __add__(self, other):
+        return GameResults(self.games_won + other.games_won,
+                           self.games_lost + other.games_lost,
+                           self.sets_won + other.sets_won,
+                           self.sets_lost + other.sets_lost,
+                           self.sets_drawn + other.sets_drawn)
+
+    def __repr__(self):
+        return (f"GameResults(games_won={self.games_won}, "
+                f"games_lost={self.games_lost}, sets_won={self.sets_won}, "
+                f"sets_lost={self.sets_lost}, sets_drawn={self.sets_drawn})")
+
+    @property
+    def games(self):
+        """Number of games played"""
+        return self.games_won + self.games_lost
+
+    @property
+    def games_per_sec(self):
+        """Games played per second (wall time)"""
+        return self.games / self.duration if self.duration else float('inf')
+
+
+def _play_shard(shard):
+    """Plays a shard of games in a fresh session, see play_n_games_parallel
 
-def get_winner():
-    """Determine the winner of the game
+    Args:
+        shard: A tuple (player, opponent, rules, n_games, seeds), where rules
+            is a tuple (score_goal, winning_sets, hand_size) and seeds a
+            tuple (seed of the session, seed of the random module)
 
     Returns:
-        The winning player, or None if game isn't over yet
+        GameResults of the shard
     """
-    if player.sets_won == WINNING_SETS:
-        return player
-    if opponent.sets_won == WINNING_SETS:
-        return opponent
-    return None
+    player, opponent, rules, n_games, (session_seed, random_seed) = shard
+    # Strategies may use the random module as well, with a stream of its own
+    random.seed(random_seed)
+    session = GameSession(copy.deepcopy(player), copy.deepcopy(opponent),
+                          random.Random(session_seed), *rules,
+                          events=NullSink())
+    session.player.sets_won, session.opponent.sets_won = 0, 0
+    session.prepare_next_set()
+    results = GameResults()
+
+    for _ in range(0, n_games):
+        winner = session.play_a_game(False, 0)
+        if winner is session.player:
+            results.games_won += 1
+        else:
+            results.games_lost += 1
+        results.sets_won += session.player.sets_won
+        results.sets_lost += session.opponent.sets_won
+        session.prepare_next_game()
+    results.sets_drawn = session.sets_drawn
+    return results
 
 
-def setup_game():
-    """Sets up the geame"""
-    player.draw_hand()
-    opponent.draw_hand()
+_default_session = None
 
 
-def determine_winner():
-    """Determine the winner of the set
+def default_session():
+    """The session playing the module level player and opponent
 
-    Returns:
-        The winning player
+    A new session is created whenever player or opponent have been
+    replaced. It uses the random module's global generator.
     """
-    player_score = player.get_score()
-    opponent_score = opponent.get_score()
-    print(f"Set over. {player.name}'s score: {player_score}, "
-          f"{opponent.name}'s score: {opponent_score}")
-
-    if player_score > SCORE_GOAL:
-        return opponent.win_set()
-    if opponent_score > SCORE_GOAL:
-        return player.win_set()
-    if opponent_score > player_score:
-        return opponent.win_set()
-    if opponent_score < player_score:
-        return player.win_set()
-    return None
+    global _default_session
+    if (_default_session is None
+            or _default_session.player is not player
+            or _default_session.opponent is not opponent):
+        _default_session = GameSession(player, opponent, rng=random)
+    return _default_session
+
+
+def set_is_over():
+    """Determines whether a set is over, see GameSession.set_is_over"""
+    return default_session().set_is_over()
+
+
+def game_is_over():
+    """Determine whether the game is over, see GameSession.game_is_over"""
+    return default_session().game_is_over()
+
+
+def get_winner():
+    """Determine the winner of the game, see GameSession.get_winner"""
+    return default_session().get_winner()
+
+
+def setup_game():
+    """Sets up the geame, see GameSession.setup_game"""
+    default_session().setup_game()
+
+
+def determine_winner():
+    """Determine the winner of the set, see GameSession.determine_winner"""
+    return default_session().determine_winner()
 
 
 def prepare_next_set():
     """Cleanup boards and prepare for for next set"""
-    player.stands, opponent.stands = False, False
-    player.clear_board()
-    opponent.clear_board()
+    default_session().prepare_next_set()
 
 
 def prepare_next_game():
     """Cleanup board and players to prepare next game"""
-    prepare_next_set()
-    player.sets_won, opponent.sets_won = 0, 0
-    player.draw_hand()
-    opponent.draw_hand()
+    default_session().prepare_next_game()
 
 
 def play_a_set(active_player, inactive_player, sleep_time=SLEEP_TIME):
-    """Plays a single set of Pazaak
-
-    Args:
-        active_player: First player to take a turn
-        inactive_player: Her opponent
-        sleep_time: Time to elapse between turns in seconds
-
-    Returns:
-        The winning player
-    """
-    while not set_is_over():
-        active_player.take_turn(inactive_player)
-        time.sleep(sleep_time)
-        active_player, inactive_player = inactive_player, active_player
-    return determine_winner()
+    """Plays a single set of Pazaak, see GameSession.play_a_set"""
+    return default_session().play_a_set(active_player, inactive_player,
+                                        sleep_time)
 
 
 def play_a_game(require_input_after_set=REQUIRE_INPUT_AFTER_SET,
                 sleep_time=SLEEP_TIME):
-    """Plays a single game of Pazaak
-
-    Args:
-        require_input_after_set: Requires user input after set is over in order
-            to suspend game progress
+    """Plays a single game of Pazaak, see GameSession.play_a_game"""
+    return default_session().play_a_game(require_input_after_set, sleep_time)
 
-    Returns:
-        The winning player
-    """
-    setup_game()
-    active_player, inactive_player = random.sample([player, opponent], 2)
-    while not game_is_over():
-        winner = play_a_set(active_player, inactive_player, sleep_time)
-        if winner is not None:
-            print(winner.name, "wins the set.")
-            # Winner starts next set
-            if winner is not active_player:
-                active_player, inactive_player = inactive_player, active_player
-        else:
-            print("Set ends with a draw.")
 
-        if require_input_after_set:
-            input(f"Sets won: {player.name}: {player.sets_won}, "
-                  f"{opponent.name}: {opponent.sets_won}.")
-        else:
-            print(f"Sets won: {player.name}: {player.sets_won}, "
-                  f"{opponent.name}: {opponent.sets_won}.")
-        prepare_next_set()
-    print(f"Game over. {get_winner().name} won. Congratulations!")
-    return get_winner()
+def play_n_games(n_games=1000):
+    """Plays n games of pazaak, see GameSession.play_n_games"""
+    return default_session().play_n_games(n_games)
 
 
-def play_n_games(n_games=1000):
-    """Plays n games of pazaak
+# Main #
+def main(args=None):
+    """Main entry point of the game. Plays one game
 
     Args:
-        n_games: The number of games to play; default 1000
-
-    Returns:
-        games_won: The number of games won by the player
+        args: Command line arguments. Default: None (sys.argv)
     """
-    games_won = 0
-    for _ in range(0, n_games):
-        if play_a_game(False, 0) is player:
-            games_won += 1
-        prepare_next_game()
-    return games_won
-
-
-# Main #
-def main():
-    """Main entry point of the game. Plays one game"""
+    global player, opponent
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--name', default=player.name,
+                        help="Your name. Default: %(default)s")
+    parser.add_argument('--opponent', choices=STRATEGIES,
+                        default='random_forest',
+                        help="Strategy of the computer opponent. "
+                        "Default: %(default)s")
+    parser.add_argument('--opponent-name', default=opponent.name,
+                        help="Name of the computer opponent. "
+                        "Default: %(default)s")
+    args = parser.parse_args(args)
+    # Fail now rather than on the opponent's first decision
+    model_file, _ = getattr(STRATEGIES[args.opponent], 'model_file',
+                            (None, None))
+    if model_file is not None and not os.path.exists(model_file):
+        parser.error(f"opponent {args.opponent} needs {model_file}, which "
+                     "doesn't exist. Create it with "
+                     f"{MODEL_FILE_COMMANDS.get(model_file, 'computer_learn')}")
+
+    player = Player.create_human(args.name)
+    opponent = Player.create_computer(args.opponent_name,
+                                      strategy_func=STRATEGIES[args.opponent])
     play_a_game()
 
 
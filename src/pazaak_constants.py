@@ -10,14 +10,59 @@ WINNING_SETS = 3
 HAND_SIZE = 4
 
 # ML settings
-DATASET_FILE_NAME = 'resources/result.csv'
+DATASET_FILE_NAME = 'resources/result.pzd'
+DATASET_MANIFEST_FILE_NAME = 'resources/result_shards.json'
+# Sets create_dataset keeps in memory before writing them and checkpointing
+DATASET_FLUSH_SIZE = 10000
 MODEL_FILE_NAME = 'resources/model.joblib'
+# Rewards of a won set: for the final action and all other actions.
+# Lost sets are rewarded with the negated values, draws with 0.
+FINAL_ACTION_REWARD = 1.
+OTHER_ACTION_REWARD = .3
 GRAPHVIZ_FILE_NAME = 'resources/graph.dot'
+POLICY_FILE_NAME = 'resources/policy.npz'
+OPTIMAL_POLICY_FILE_NAME = 'resources/optimal_policy.npz'
+MODEL_SCORES_FILE_NAME = 'resources/model_scores.csv'
 
 DECISION_TREE_DEFAULT_DATASET = 'resources/result_80.csv'
 DECISION_TREE_DEFAULT_MODEL = 'resources/model_dt.joblib'
 RANDOM_FOREST_DEFAULT_DATASET = 'resources/result_95.csv'
 RANDOM_FOREST_DEFAULT_MODEL = 'resources/model_rf.joblib'
+DECISION_TREE_DEFAULT_POLICY = 'resources/policy_dt.npz'
+RANDOM_FOREST_DEFAULT_POLICY = 'resources/policy_rf.npz'
+# Range of scores covered by compiled policies. Lower scores can only be
+# reached by playing negative cards, higher ones mean the player busted.
+POLICY_MIN_SCORE = -20
+POLICY_MAX_SCORE = 30
+
+# Monte Carlo strategy: time budget per decision (in seconds), maximum
+# number of rollouts per action, rollouts per action and round, and the
+# z value of the confidence bounds used to drop actions early
+MONTE_CARLO_TIME_BUDGET = .005
+MONTE_CARLO_MAX_ROLLOUTS = 2000
+MONTE_CARLO_BATCH_SIZE = 64
+MONTE_CARLO_CONFIDENCE = 2.58
+# Number of models kept in memory by the model cache
+MODEL_CACHE_SIZE = 8
+# Seconds between two checks whether a cached model file has changed
+MODEL_CACHE_CHECK_INTERVAL = 1
+# Number of decisions cached per memoized strategy
+STRATEGY_CACHE_SIZE = 100000
+# Tournament: games per pairing and round, maximum games per pairing and
+# z value of the rating intervals
+TOURNAMENT_GAMES_PER_ROUND = 50
+TOURNAMENT_MAX_GAMES = 1000
+TOURNAMENT_CONFIDENCE = 1.96
+# Sequential evaluation: error rates and distance of the hypotheses to
+# the baseline win rate, see sequential module
+SPRT_ALPHA = .05
+SPRT_BETA = .05
+SPRT_EFFECT = .05
+# Benchmark suite: stored baseline, latest results and the relative
+# slowdown flagged as a regression
+BENCHMARK_BASELINE_FILE_NAME = 'resources/benchmark_baseline.json'
+BENCHMARK_RESULTS_FILE_NAME = 'resources/benchmark_results.json'
+BENCHMARK_REGRESSION_THRESHOLD = .2
 
 # internal settings
 # timeout after every turn, in seconds
@@ -7,18 +7,23 @@ import random
 from abc import ABCMeta, abstractmethod
 
 from pazaak_constants import SCORE_GOAL, HAND_SIZE
-from computer_strategies import blackjack_like_strategy
+from computer_strategies import blackjack_like_strategy, memoize_strategy
+from events import CONSOLE, TurnStarted, CardDrawn, CardPlayed, Standing, \
+    Stood, Busted
 
 NEUTRAL_CARDS = range(1, 11)
 
 
-def draw_card():
+def draw_card(rng=random):
     """Draw a card
 
+    Args:
+        rng: Random number generator to use. Default: the random module
+
     Returns:
         A random card chosen from the stack of neutral cards
     """
-    return random.choice(NEUTRAL_CARDS)
+    return rng.choice(NEUTRAL_CARDS)
 
 
 class AbstractPlayer(metaclass=ABCMeta):
@@ -47,13 +52,19 @@ class AbstractPlayer(metaclass=ABCMeta):
         return HumanPlayer(name)
 
     @classmethod
-    def create_computer(cls, name, strategy_func=blackjack_like_strategy):
+    def create_computer(cls, name, strategy_func=blackjack_like_strategy,
+                        memoize=True):
         """Creates a computer player
 
         Args:
             name: Player's name
             strategy_func: computer strategy fuction to use
+            memoize: Whether to cache the strategy's decisions, see
+                computer_strategies.memoize_strategy. Strategies marked as
+                not_memoized are never cached.
         """
+        if memoize:
+            strategy_func = memoize_strategy(strategy_func)
         return ComputerPlayer(name, strategy_func)
 
     @classmethod
@@ -67,15 +78,37 @@ class AbstractPlayer(metaclass=ABCMeta):
         self.stands = False
         self.sets_won = 0
         self.name = name
+        # Set by the game session the player takes part in
+        self.rng = random
+        self.score_goal = SCORE_GOAL
+        self.hand_size = HAND_SIZE
+        self.events = CONSOLE
+
+    def __getstate__(self):
+        # The random module can't be pickled. The receiving process binds the
+        # player to a session of its own anyway.
+        state = self.__dict__.copy()
+        if state['rng'] is random:
+            del state['rng']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'rng' not in state:
+            self.rng = random
 
     def stand(self):
         """Used when a player decides to stand (not accepting any more cards)"""
-        print(self.name + " stands.")
+        self.events.emit(Stood, self.name)
         self.stands = True
 
-    def bust(self):
-        """Used when a player busts (due to too high score)"""
-        print(self.name + " busted.")
+    def bust(self, stand=False):
+        """Used when a player busts (due to too high score)
+
+        Args:
+            stand: Whether she had decided to stand as well
+        """
+        self.events.emit(Busted, self.name, stand)
         self.stands = True
 
     def clear_board(self):
@@ -109,7 +142,7 @@ class AbstractPlayer(metaclass=ABCMeta):
 
     def draw_hand(self):
         """Draw cards from the side deck to initiate a new game"""
-        self.hand = random.sample(self.side_deck, HAND_SIZE)
+        self.hand = self.rng.sample(self.side_deck, self.hand_size)
 
     def play_card_at(self, index):
         """Plays card at index
@@ -120,8 +153,8 @@ class AbstractPlayer(metaclass=ABCMeta):
         if index < len(self.hand):
             value = self.hand.pop(index)
             self.board.append(value)
-            print(f"{self.name} plays a {value}.", end=" ")
-            print(self.get_status_string())
+            self.events.emit(CardPlayed, self.name, value, self.board,
+                             index)
 
     def take_turn(self, opponent):
         """Take a turn: Player draws a card, plays a card from her hand if
@@ -130,14 +163,14 @@ class AbstractPlayer(metaclass=ABCMeta):
         Args:
             opponent: The player's opponent
         """
-        print(f"{self.name}'s turn.")
+        self.events.emit(TurnStarted, self.name)
         if not self.stands:
-            card = draw_card()
+            card = draw_card(self.rng)
             self.board.append(card)
-            print(f"{self.name} drew a {card}. {self.get_status_string()}")
+            self.events.emit(CardDrawn, self.name, card, self.board)
             self.play_card_or_stand(opponent)
         else:
-            print(f"{self.name} stands. {self.get_status_string()}")
+            self.events.emit(Standing, self.name, self.board)
 
 
 class HumanPlayer(AbstractPlayer):
@@ -152,7 +185,7 @@ class HumanPlayer(AbstractPlayer):
     def play_card_or_stand(self, opponent):
 
         # If we're having 20 points, there's no point in playing a card
-        if self.get_score() == SCORE_GOAL:
+        if self.get_score() == self.score_goal:
             self.stand()
 
         # Else, we ask the player to play a card
@@ -164,9 +197,9 @@ class HumanPlayer(AbstractPlayer):
                 self.play_card_at(card_index)
 
             # If player busted or reached 20, she must stand
-            if self.get_score() == SCORE_GOAL:
+            if self.get_score() == self.score_goal:
                 self.stand()
-            elif self.get_score() > SCORE_GOAL:
+            elif self.get_score() > self.score_goal:
                 self.bust()
 
             # else we ask her whether to stand
@@ -193,7 +226,7 @@ class ComputerPlayer(AbstractPlayer):
             self.play_card_at(card_index)
 
         # Check if we busted
-        if self.get_score() > SCORE_GOAL:
-            self.bust()
+        if self.get_score() > self.score_goal:
+            self.bust(stand)
         elif stand:
             self.stand()
@@ -0,0 +1,186 @@
+"""Opt-in instrumentation of the game loop
+
+A Profiler records call counts and latency histograms per phase of the game:
+turns (AbstractPlayer.take_turn) and strategy decisions per strategy,
+neutral card draws (pazaak_player.draw_card), determine_winner and whole
+sets and games. Instrumentation is installed by wrapping these functions
+for the duration of a with block, see Profiler.instrument, so the game loop
+doesn't pay anything when profiling is disabled.
+
+For a function level view, profile_games runs play_n_games under cProfile.
+"""
+
+import cProfile
+import functools
+import json
+import math
+import pstats
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter_ns
+
+import pazaak_player
+
+# Histogram resolution: buckets per doubling of the latency. 8 buckets keep
+# the relative error of percentiles below 9%.
+BUCKETS_PER_OCTAVE = 8
+
+
+class LatencyHistogram:
+    """Histogram of latencies in logarithmic buckets"""
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total_ns = 0
+
+    def record(self, latency_ns):
+        """Adds a latency, in nanoseconds"""
+        self.buckets[int(math.log2(max(latency_ns, 1))
+                         * BUCKETS_PER_OCTAVE)] += 1
+        self.count += 1
+        self.total_ns += latency_ns
+
+    def percentile(self, percent):
+        """Latency below which percent of the recorded latencies fall
+
+        Returns:
+            Upper bound of the bucket containing the percentile, in seconds
+        """
+        if not self.count:
+            return 0.
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                break
+        return 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) / 1e9
+
+    def to_dict(self):
+        """Summary: count, total and mean (in seconds), p50, p95 and p99"""
+        return {
+            'count': self.count,
+            'total': self.total_ns / 1e9,
+            'mean': self.total_ns / self.count / 1e9 if self.count else 0.,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+def strategy_name(strategy_func):
+    """Name of a strategy function, unwrapping memoization and partials"""
+    while True:
+        if isinstance(strategy_func, functools.partial):
+            strategy_func = strategy_func.func
+        elif hasattr(strategy_func, 'strategy_func'):
+            strategy_func = strategy_func.strategy_func
+        else:
+            return getattr(strategy_func, '__name__', repr(strategy_func))
+
+
+class Profiler:
+    """Records latency histograms per phase of the game
+
+    Phases are named 'game', 'set', 'determine_winner', 'draw_card',
+    'take_turn.<strategy>' and 'strategy.<strategy>', <strategy> being the
+    name of the player's strategy function (or 'human').
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    def timed(self, phase, func):
+        """Wraps func, recording the latency of every call in phase"""
+        histogram = self.phases.setdefault(phase, LatencyHistogram())
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.record(perf_counter_ns() - start)
+        return wrapper
+
+    @contextmanager
+    def instrument(self, session):
+        """Instruments a game session within a with block
+
+        The session's methods and its players' methods and strategies are
+        replaced by timed wrappers, which are removed on exit. Neutral card
+        draws are timed process wide.
+
+        Args:
+            session: The pazaak.GameSession to instrument
+        """
+        originals = []
+
+        def wrap(owner, attribute, phase):
+            originals.append((owner, attribute, owner.__dict__.get(attribute)))
+            setattr(owner, attribute,
+                    self.timed(phase, getattr(owner, attribute)))
+
+        wrap(session, 'play_a_game', 'game')
+        wrap(session, 'play_a_set', 'set')
+        wrap(session, 'determine_winner', 'determine_winner')
+        for player in (session.player, session.opponent):
+            strategy_func = getattr(player, 'strategy_func', None)
+            name = 'human' if strategy_func is None \
+                else strategy_name(strategy_func)
+            wrap(player, 'take_turn', f'take_turn.{name}')
+            if strategy_func is not None:
+                wrap(player, 'strategy_func', f'strategy.{name}')
+        wrap(pazaak_player, 'draw_card', 'draw_card')
+        try:
+            yield self
+        finally:
+            for owner, attribute, original in reversed(originals):
+                if original is None:
+                    delattr(owner, attribute)
+                else:
+                    setattr(owner, attribute, original)
+
+    def to_dict(self):
+        """Summary of all phases, see LatencyHistogram.to_dict"""
+        return {phase: histogram.to_dict()
+                for phase, histogram in sorted(self.phases.items())}
+
+    def dump(self, file_name):
+        """Writes the summary of all phases to a JSON file"""
+        with open(file_name, 'w') as json_file:
+            json.dump(self.to_dict(), json_file, indent=2)
+
+    def report(self):
+        """Prints a table of all phases"""
+        print(f"{'phase':45} {'count':>8} {'mean':>9} {'p50':>9} "
+              f"{'p95':>9} {'p99':>9}")
+        for phase, summary in self.to_dict().items():
+            print(f"{phase:45} {summary['count']:8} " + " ".join(
+                f"{summary[key] * 1e6:7.1f}us"
+                for key in ('mean', 'p50', 'p95', 'p99')))
+
+
+def profile_games(session, n_games=1000, stats_file_name=None,
+                  sort='cumulative', limit=20):
+    """Plays n games under cProfile and prints the most expensive functions
+
+    Args:
+        session: The pazaak.GameSession to play
+        n_games: Number of games to play. Default: 1000
+        stats_file_name: File to dump the raw stats to, to be loaded with
+            pstats. Default: None (not dumped)
+        sort: Sort key of the printed stats. Default: 'cumulative'
+        limit: Number of functions printed
+
+    Returns:
+        pstats.Stats of the run
+    """
+    profile = cProfile.Profile()
+    profile.runcall(session.play_n_games, n_games)
+    if stats_file_name is not None:
+        profile.dump_stats(stats_file_name)
+    stats = pstats.Stats(profile)
+    stats.sort_stats(sort).print_stats(limit)
+    return stats
@@ -0,0 +1,211 @@
+"""Compact binary log of the turns played, to keep simulated games for
+analysis and retraining
+
+A ReplayWriter is an event sink (see events module): hooked into a game
+session, it writes one fixed-width record (RECORD_DTYPE) per turn in which
+a player drew a card. A record holds the state the player decided in, the
+card she played (if any), whether she decided to stand, whether she
+busted and the outcome of the set from her point of view. Records are
+buffered per set and appended once the set is over, so memory doesn't grow
+with the number of games.
+
+A ReplayLog memory maps a log for random access to any game or set. See
+computer_learn.dataset_from_replay to derive training datasets from it.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from events import CardDrawn, CardPlayed, Stood, Busted, SetOver, GameOver
+from pazaak_constants import SCORE_GOAL
+
+MAGIC = b'PZKREPL1'
+HEADER_SIZE = 256
+VERSION = 1
+
+RECORD_DTYPE = np.dtype([
+    ('game', '<u4'),         # Game index within the log
+    ('set', '<u4'),          # Set index within the log
+    ('turn', '<u2'),         # Turn index within the set
+    ('seat', 'u1'),          # 0 for the player, 1 for the opponent
+    ('drawn_card', 'i1'),
+    ('self_score', 'i1'),    # Score after drawing, before playing a card
+    ('opp_score', 'i1'),
+    ('opp_stands', '?'),
+    ('card_index', 'i1'),    # Index in hand of the card played, -1 if none
+    ('card_val', 'i1'),      # Value of the card played, 0 if none
+    ('stand', '?'),          # Whether the player decided to stand
+    ('bust', '?'),
+    ('outcome', 'i1'),       # 1 if the seat won the set, 0 draw, -1 lost
+])
+
+
+class ReplayWriter:
+    """Event sink writing a replay log
+
+    Players are identified by name, so both need distinct names.
+
+    Args:
+        file_name: Log file to write
+        player_name: Name of the player in seat 0
+        opponent_name: Name of the player in seat 1
+        score_goal: Score goal of the session. Default: SCORE_GOAL
+        append: Whether to append to an existing log
+    """
+
+    def __init__(self, file_name, player_name, opponent_name,
+                 score_goal=SCORE_GOAL, append=False):
+        self.seats = {player_name: 0, opponent_name: 1}
+        self.score_goal = score_goal
+        self.games, self.sets = 0, 0
+        if append and os.path.exists(file_name):
+            log = ReplayLog(file_name)
+            if len(log):
+                self.games = int(log.records['game'][-1]) + 1
+                self.sets = int(log.records['set'][-1]) + 1
+            del log
+            self._file = open(file_name, 'ab')
+        else:
+            self._file = open(file_name, 'wb')
+            header = MAGIC + json.dumps({
+                'version': VERSION, 'player': player_name,
+                'opponent': opponent_name,
+                'record_size': RECORD_DTYPE.itemsize}).encode()
+            if len(header) > HEADER_SIZE:
+                raise ValueError("Player names too long")
+            self._file.write(header.ljust(HEADER_SIZE))
+        self._records = []
+        self._reset_set()
+
+    def _reset_set(self):
+        self._records.clear()
+        self._scores = [0, 0]
+        self._stands = [False, False]
+        self._turn = None
+
+    def emit(self, event_type, *fields):
+        """Updates the current set's records"""
+        if event_type is CardDrawn:
+            name, card, board = fields
+            seat = self.seats[name]
+            self._scores[seat] = sum(board)
+            self._turn = [self.games, self.sets, len(self._records), seat,
+                          card, self._scores[seat], self._scores[1 - seat],
+                          self._stands[1 - seat], -1, 0, False, False, 0]
+            self._records.append(self._turn)
+        elif event_type is CardPlayed:
+            name, card, board, index = fields
+            self._scores[self.seats[name]] = sum(board)
+            if self._turn is not None:
+                self._turn[8], self._turn[9] = index, card
+        elif event_type is Stood:
+            self._stands[self.seats[fields[0]]] = True
+            if self._turn is not None:
+                self._turn[10] = True
+        elif event_type is Busted:
+            self._stands[self.seats[fields[0]]] = True
+            if self._turn is not None:
+                self._turn[10], self._turn[11] = fields[1], True
+        elif event_type is SetOver:
+            self._end_set(fields[1], fields[3])
+        elif event_type is GameOver:
+            self.games += 1
+
+    def _end_set(self, player_score, opponent_score):
+        goal = self.score_goal
+        if player_score > goal:
+            outcome = -1
+        elif opponent_score > goal:
+            outcome = 1
+        else:
+            outcome = (player_score > opponent_score) \
+                - (player_score < opponent_score)
+        records = np.array([tuple(record) for record in self._records],
+                           RECORD_DTYPE)
+        records['outcome'] = np.where(records['seat'] == 0, outcome,
+                                      -outcome)
+        self._file.write(records.tobytes())
+        self.sets += 1
+        self._reset_set()
+
+    def flush(self, sync=False):
+        """Flushes the sets written so far to disk
+
+        Args:
+            sync: Whether to wait until the operating system has written
+                them as well, e.g. before checkpointing
+
+        Returns:
+            The size of the log in bytes
+        """
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        """Closes the log. Turns of an unfinished set are dropped."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplayLog:
+    """Memory mapped replay log written by ReplayWriter
+
+    Attributes:
+        records: Structured array of all turns (see RECORD_DTYPE), ordered by
+            game, set and turn
+        player: Name of the player in seat 0
+        opponent: Name of the player in seat 1
+    """
+
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as log_file:
+            raw = log_file.read(HEADER_SIZE)
+        if raw[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{file_name} is not a replay log")
+        header = json.loads(raw[len(MAGIC):].decode())
+        if header['version'] != VERSION:
+            raise ValueError(f"Unsupported replay log version "
+                             f"{header['version']}")
+        self.player, self.opponent = header['player'], header['opponent']
+        n_records = (os.path.getsize(file_name) - HEADER_SIZE) \
+            // RECORD_DTYPE.itemsize
+        if n_records:
+            self.records = np.memmap(file_name, RECORD_DTYPE, 'r',
+                                     HEADER_SIZE, (n_records,))
+        else:
+            self.records = np.empty(0, RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def n_games(self):
+        """Number of games logged (including an unfinished last one)"""
+        return int(self.records['game'][-1]) + 1 if len(self) else 0
+
+    @property
+    def n_sets(self):
+        """Number of sets logged"""
+        return int(self.records['set'][-1]) + 1 if len(self) else 0
+
+    def _select(self, column, value):
+        values = self.records[column]
+        return self.records[np.searchsorted(values, value, 'left'):
+                            np.searchsorted(values, value, 'right')]
+
+    def game(self, game):
+        """Turns of a game, a view of the memory mapped records"""
+        return self._select('game', game)
+
+    def set(self, set_index):
+        """Turns of a set, a view of the memory mapped records"""
+        return self._select('set', set_index)
@@ -0,0 +1,105 @@
+"""Sequential probability ratio test (SPRT) of a win rate
+
+Rather than playing a fixed number of games, games are played one at a time
+until the results decide between a win rate of baseline - effect (the
+strategy is worse) and baseline + effect (it's better), with error rates
+alpha and beta. Clear cases are decided after few games.
+"""
+
+import math
+
+from pazaak_constants import SPRT_ALPHA, SPRT_BETA, SPRT_EFFECT
+
+BETTER = 'better'
+WORSE = 'worse'
+INCONCLUSIVE = 'inconclusive'
+
+
+class SPRT:
+    """Wald's SPRT of H0: p = baseline - effect against
+    H1: p = baseline + effect, p being the win rate
+
+    Args:
+        baseline: Win rate to compare with. Default: .5
+        effect: Distance of both hypotheses to the baseline
+        alpha: Probability to decide 'better' if H0 holds
+        beta: Probability to decide 'worse' if H1 holds
+    """
+
+    def __init__(self, baseline=.5, effect=SPRT_EFFECT, alpha=SPRT_ALPHA,
+                 beta=SPRT_BETA):
+        p_worse = max(baseline - effect, 1e-9)
+        p_better = min(baseline + effect, 1 - 1e-9)
+        self.win_llr = math.log(p_better / p_worse)
+        self.loss_llr = math.log((1 - p_better) / (1 - p_worse))
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.llr = 0.
+        self.games = 0
+        self.games_won = 0
+
+    def update(self, won):
+        """Adds the result of a game
+
+        Returns:
+            The decision, see decision
+        """
+        self.games += 1
+        if won:
+            self.games_won += 1
+            self.llr += self.win_llr
+        else:
+            self.llr += self.loss_llr
+        return self.decision()
+
+    def decision(self):
+        """BETTER or WORSE once decided, else None"""
+        if self.llr >= self.upper:
+            return BETTER
+        if self.llr <= self.lower:
+            return WORSE
+        return None
+
+
+class SequentialResult:
+    """Result of a sequential evaluation
+
+    Attributes:
+        decision: BETTER, WORSE or INCONCLUSIVE (maximum games reached)
+        games: Number of games played
+        games_won: Number of games won
+        llr: Final log-likelihood ratio
+    """
+
+    def __init__(self, decision, games, games_won, llr):
+        self.decision = decision
+        self.games = games
+        self.games_won = games_won
+        self.llr = llr
+
+    def __repr__(self):
+        return (f"SequentialResult(decision={self.decision!r}, "
+                f"games={self.games}, games_won={self.games_won})")
+
+    @property
+    def win_rate(self):
+        """Share of games won"""
+        return self.games_won / self.games if self.games else 0.
+
+    def confidence_interval(self, z_value=1.96):
+        """Wilson score interval of the win rate
+
+        Note that stopping early biases the estimate towards the decision,
+        so the interval is a rough guide.
+
+        Returns:
+            A tuple (low, high)
+        """
+        if not self.games:
+            return 0., 1.
+        n_games, rate = self.games, self.win_rate
+        center = (rate + z_value ** 2 / (2 * n_games)) \
+            / (1 + z_value ** 2 / n_games)
+        margin = z_value / (1 + z_value ** 2 / n_games) * math.sqrt(
+            rate * (1 - rate) / n_games + z_value ** 2 / (4 * n_games ** 2))
+        return center - margin, center + margin
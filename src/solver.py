@@ -0,0 +1,261 @@
+"""Computes the expected-value-optimal action for every state of a set
+
+The player's state in a set consists of her score, the opponent's score,
+whether either of them stands and the cards left in her hand, a multiset of
+side deck values. Neutral cards are drawn uniformly from NEUTRAL_CARDS. The
+opponent plays a given strategy function. As the opponent's hand is hidden
+(strategies don't get to see it), she is modeled without side cards, so the
+strategy only decides whether to stand. The actions are thus only optimal
+against opponents who don't play side cards.
+
+Values are computed by dynamic programming: hands are solved in order of
+increasing size, as playing a card moves to a smaller hand. For a fixed
+hand, values only depend on states with higher scores, so they're filled in
+descending score order, vectorized over the other score. A set won counts 1,
+a draw 0 and a set lost -1.
+
+The optimal action of every decision state is written to a compact table
+used by computer_strategies.optimal_strategy.
+"""
+
+import itertools
+from timeit import default_timer as timer
+
+import numpy as np
+
+from computer_strategies import blackjack_like_strategy
+from pazaak_constants import SCORE_GOAL, HAND_SIZE, POLICY_MIN_SCORE, \
+    OPTIMAL_POLICY_FILE_NAME
+from pazaak_player import ComputerPlayer, NEUTRAL_CARDS
+
+
+class Solver:
+    """Expectimax solver of a single set against a given opponent strategy
+
+    Args:
+        opponent_strategy: Deterministic strategy function of the opponent.
+            Default: blackjack_like_strategy
+        side_deck: Side deck hands are drawn from
+        hand_size: Maximum number of cards in hand
+        min_score: Lowest score considered. Lower scores are treated as
+            min_score; they can't be reached with the default side deck.
+    """
+
+    def __init__(self, opponent_strategy=blackjack_like_strategy,
+                 side_deck=ComputerPlayer.side_deck, hand_size=HAND_SIZE,
+                 min_score=POLICY_MIN_SCORE):
+        self.opponent_strategy = opponent_strategy
+        self.card_values = sorted(set(side_deck))
+        self.max_counts = [side_deck.count(val) for val in self.card_values]
+        self.hand_size = hand_size
+        self.min_score = min_score
+        # Scores before drawing (index: score - min_score)
+        self.n_scores = SCORE_GOAL - min_score + 1
+        self.draws = np.array(NEUTRAL_CARDS)
+        self.max_draw = max(NEUTRAL_CARDS)
+        # Scores after drawing (index: score - min_score - 1)
+        self.n_drawn = self.n_scores + self.max_draw - 1
+
+        self.hands = []
+        self.decisions = None
+        self.start_values = None
+        self.solve_time = 0.
+
+    def hand_code(self, counts):
+        """Canonical integer encoding of a hand given as counts per value"""
+        code = 0
+        for count, max_count in zip(counts, self.max_counts):
+            code = code * (max_count + 1) + count
+        return code
+
+    def _enumerate_hands(self):
+        hands = [counts for counts in itertools.product(
+            *(range(max_count + 1) for max_count in self.max_counts))
+                 if sum(counts) <= self.hand_size]
+        return sorted(hands, key=sum)
+
+    def _opponent_stands(self):
+        """Whether the opponent stands after drawing, indexed by
+        [self stands, opponent's score, player's score]
+        """
+        stands = np.zeros((2, self.n_scores, self.n_scores), dtype=bool)
+        scores = range(self.min_score, SCORE_GOAL + 1)
+        for self_stands in (0, 1):
+            for opp_indx, opp_score in enumerate(scores):
+                for indx, score in enumerate(scores):
+                    stands[self_stands, opp_indx, indx] = \
+                        self.opponent_strategy([], opp_score, score,
+                                               bool(self_stands))[2]
+        return stands
+
+    def _lookup(self, values, new_scores):
+        """Values at new_scores (one per score), -1 for a bust"""
+        indices = np.clip(new_scores - self.min_score, 0, self.n_scores - 1)
+        return np.where(new_scores > SCORE_GOAL, -1., values[indices])
+
+    def solve(self):
+        """Solves all states
+
+        Returns:
+            The solver, for chaining
+        """
+        start = timer()
+        n_scores, n_drawn, max_draw = self.n_scores, self.n_drawn, \
+            self.max_draw
+        scores = np.arange(self.min_score, SCORE_GOAL + 1)
+        drawn_scores = np.arange(self.min_score + 1,
+                                 SCORE_GOAL + max_draw + 1)
+        opp_stands = self._opponent_stands()
+        # compare[s, o]: Result if both stand
+        compare = np.sign(scores[:, None] - scores[None, :]).astype(float)
+
+        # Player stands, opponent draws: wait[s, o]
+        wait = np.zeros((n_scores, n_scores))
+        for opp in range(n_scores - 1, -1, -1):
+            total = np.zeros(n_scores)
+            for draw in self.draws:
+                new_opp = opp + draw
+                if new_opp >= n_scores:
+                    total += 1
+                else:
+                    total += np.where(opp_stands[1, new_opp],
+                                      compare[:, new_opp], wait[:, new_opp])
+            wait[:, opp] = total / len(self.draws)
+
+        self.hands = self._enumerate_hands()
+        hand_indices = {hand: indx for indx, hand in enumerate(self.hands)}
+        # Values of states where both don't stand at the start of the
+        # opponent's turn (opp_turn) and where the opponent stands
+        # (opp_standing), indexed by hand, [s, o]
+        opp_turn = np.zeros((len(self.hands), n_scores, n_scores))
+        opp_standing = np.zeros((len(self.hands), n_scores, n_scores))
+        # Action per hand, [drawn score, o, opponent stands]. 0 means no
+        # card, k the (k-1)-th card value. Stand flag as lowest bit.
+        self.decisions = np.zeros((len(self.hands), n_drawn, n_scores, 2),
+                                  dtype=np.int8)
+        self.start_values = np.zeros((len(self.hands), 2))
+
+        for hand_indx, hand in enumerate(self.hands):
+            # Possible actions: (card number, value, index of remaining hand)
+            actions = [(0, 0, hand_indx)]
+            for card, (val, count) in enumerate(zip(self.card_values, hand)):
+                if count:
+                    remaining = hand[:card] + (count - 1,) + hand[card + 1:]
+                    actions.append((card + 1, val, hand_indices[remaining]))
+
+            # Opponent stands: Fill values in descending player's score.
+            standing = opp_standing[hand_indx]
+            decided = np.zeros((n_drawn, n_scores))
+            for score in range(SCORE_GOAL + max_draw, self.min_score - 1, -1):
+                indx = score - self.min_score
+                if score <= SCORE_GOAL:
+                    standing[indx] = decided[indx:indx + max_draw].mean(axis=0)
+                if score > self.min_score:
+                    best, choice = None, None
+                    for card, val, remaining in actions:
+                        new_score = score + val
+                        if new_score > SCORE_GOAL:
+                            candidates = (np.full(n_scores, -1.),) * 2
+                        else:
+                            new_indx = max(new_score - self.min_score, 0)
+                            candidates = (opp_standing[remaining][new_indx],
+                                          compare[new_indx])
+                        for stand, value in enumerate(candidates):
+                            if best is None:
+                                best, choice = value, np.zeros(n_scores,
+                                                               np.int8)
+                                continue
+                            better = value > best
+                            best = np.where(better, value, best)
+                            choice[better] = card * 2 + stand
+                    decided[indx - 1] = best
+                    self.decisions[hand_indx, indx - 1, :, 1] = choice
+
+            # Nobody stands: Fill values in descending opponent's score.
+            turn = opp_turn[hand_indx]
+            own_turn = np.zeros((n_scores, n_scores))
+            for opp in range(n_scores - 1, -1, -1):
+                total = np.zeros(n_scores)
+                for draw in self.draws:
+                    new_opp = opp + draw
+                    if new_opp >= n_scores:
+                        total += 1
+                    else:
+                        total += np.where(opp_stands[0, new_opp],
+                                          standing[:, new_opp],
+                                          own_turn[:, new_opp])
+                turn[:, opp] = total / len(self.draws)
+
+                best, choice = None, None
+                for card, val, remaining in actions:
+                    new_scores = drawn_scores + val
+                    candidates = (
+                        self._lookup(opp_turn[remaining][:, opp], new_scores),
+                        self._lookup(wait[:, opp], new_scores))
+                    for stand, value in enumerate(candidates):
+                        if best is None:
+                            best, choice = value, np.zeros(n_drawn, np.int8)
+                            continue
+                        better = value > best
+                        best = np.where(better, value, best)
+                        choice[better] = card * 2 + stand
+                self.decisions[hand_indx, :, opp, 0] = choice
+                window = np.concatenate(([0.], np.cumsum(best)))
+                own_turn[:, opp] = (window[max_draw:]
+                                    - window[:-max_draw]) / max_draw
+
+            start_indx = -self.min_score
+            self.start_values[hand_indx] = (own_turn[start_indx, start_indx],
+                                            turn[start_indx, start_indx])
+
+        self.solve_time = timer() - start
+        self._memory = opp_turn.nbytes + opp_standing.nbytes + wait.nbytes
+        return self
+
+    def save(self, table_file_name=OPTIMAL_POLICY_FILE_NAME):
+        """Writes the decision table, to be loaded by
+        computer_strategies.load_optimal_policy
+        """
+        codes = np.array([self.hand_code(hand) for hand in self.hands])
+        order = np.argsort(codes)
+        np.savez(table_file_name,
+                 hand_codes=codes[order],
+                 decisions=self.decisions[order],
+                 card_values=np.array(self.card_values),
+                 max_counts=np.array(self.max_counts),
+                 min_score=self.min_score)
+
+    def report(self):
+        """Solve time, table size and memory used while solving
+
+        Returns:
+            dict containing solve_time (s), states (number of decision
+            states), table_bytes and solver_bytes
+        """
+        return {
+            'solve_time': self.solve_time,
+            'states': self.decisions.size,
+            'table_bytes': self.decisions.nbytes,
+            'solver_bytes': self._memory,
+        }
+
+
+def solve(opponent_strategy=blackjack_like_strategy,
+          table_file_name=OPTIMAL_POLICY_FILE_NAME):
+    """Solves the set against opponent_strategy and writes the decision table
+    used by optimal_strategy
+
+    Returns:
+        The solver's report, see Solver.report
+    """
+    solver = Solver(opponent_strategy).solve()
+    solver.save(table_file_name)
+    report = solver.report()
+    print(f"Solved {report['states']} states in {report['solve_time']:.1f} "
+          f"seconds using {report['solver_bytes'] / 2**20:.1f} MB. "
+          f"Table size: {report['table_bytes'] / 2**20:.1f} MB.")
+    return report
+
+
+if __name__ == '__main__':
+    solve()
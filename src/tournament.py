@@ -0,0 +1,228 @@
+"""Round-robin tournament between computer strategies with Bradley-Terry
+ratings
+
+Every pairing of strategies plays a first round of games. Afterwards, a
+Bradley-Terry model is fitted to all results and its ratings are reported
+on the Elo scale with confidence intervals. Further rounds are only played
+by pairings whose rating intervals still overlap, until all of them are
+separated or have played their maximum number of games. Rankings are
+therefore obtained with far fewer games than a round robin with a fixed
+number of games per pairing.
+"""
+
+import itertools
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import pazaak
+from pazaak_player import AbstractPlayer as Player
+from computer_strategies import random_strategy, blackjack_like_strategy, \
+    decision_tree_strategy, random_forest_strategy
+from events import NullSink
+from pazaak_constants import TOURNAMENT_GAMES_PER_ROUND, \
+    TOURNAMENT_MAX_GAMES, TOURNAMENT_CONFIDENCE
+
+ELO_SCALE = 400 / math.log(10)
+ELO_MEAN = 1500
+
+
+def fit_bradley_terry(wins, prior=.5, iterations=1000, tolerance=1e-9):
+    """Fits a Bradley-Terry model to the results of a tournament
+
+    Every pairing that played gets prior virtual wins for either side, so
+    that strategies that won (or lost) all of their games have finite
+    ratings.
+
+    Args:
+        wins: Array of shape (n, n): wins[i, j] is the number of games
+            strategy i won against strategy j
+        prior: Virtual wins per side and pairing. Default: .5
+        iterations: Maximum number of iterations
+        tolerance: Convergence threshold of the log-strengths
+
+    Returns:
+        A tuple (strengths, covariance): log-strengths (summing up to 0) and
+        their covariance matrix. The probability that i beats j is
+        1 / (1 + exp(strengths[j] - strengths[i])).
+    """
+    games = wins + wins.T
+    wins = wins + prior * (games > 0)
+    games = wins + wins.T
+    total_wins = wins.sum(axis=1)
+
+    strengths = np.ones(len(wins))
+    for _ in range(iterations):
+        # Minorization-maximization update (Hunter 2004)
+        updated = total_wins / (
+            games / (strengths[:, None] + strengths[None, :])).sum(axis=1)
+        updated /= np.exp(np.log(updated).mean())
+        converged = np.max(np.abs(np.log(updated / strengths))) < tolerance
+        strengths = updated
+        if converged:
+            break
+
+    log_strengths = np.log(strengths)
+    win_prob = 1 / (1 + np.exp(log_strengths[None, :]
+                               - log_strengths[:, None]))
+    information = games * win_prob * win_prob.T
+    information = np.diag(information.sum(axis=1)) - information
+    return log_strengths, np.linalg.pinv(information)
+
+
+class Tournament:
+    """Tournament between strategies, see module docstring
+
+    Args:
+        strategies: dict mapping names to strategy functions. They have to be
+            picklable (e.g. module level functions or functools.partial).
+        games_per_round: Games played per pairing and round
+        max_games: Maximum number of games per pairing
+        confidence: z value of the rating intervals
+        workers: Number of processes. Default: number of CPUs
+        seed: Master seed. Default: None (random seed)
+    """
+
+    def __init__(self, strategies, games_per_round=TOURNAMENT_GAMES_PER_ROUND,
+                 max_games=TOURNAMENT_MAX_GAMES,
+                 confidence=TOURNAMENT_CONFIDENCE, workers=None, seed=None):
+        self.names = list(strategies)
+        self.strategies = strategies
+        self.games_per_round = games_per_round
+        self.max_games = max_games
+        self.confidence = confidence
+        self.workers = workers
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self.seed = seed
+        self._seed_rng = random.Random(seed)
+        self.wins = np.zeros((len(strategies), len(strategies)), np.int64)
+        self.rounds = 0
+
+    @property
+    def games_played(self):
+        """Total number of games played"""
+        return int(self.wins.sum())
+
+    def ratings(self):
+        """Current ratings on the Elo scale
+
+        Returns:
+            DataFrame with columns strategy, rating, rating_low, rating_high
+            (bounds of the confidence interval) and games, sorted by rating
+        """
+        strengths, covariance = fit_bradley_terry(self.wins)
+        ratings = ELO_MEAN + ELO_SCALE * strengths
+        margin = self.confidence * ELO_SCALE * np.sqrt(
+            np.maximum(np.diag(covariance), 0))
+        return pd.DataFrame({
+            'strategy': self.names,
+            'rating': ratings,
+            'rating_low': ratings - margin,
+            'rating_high': ratings + margin,
+            'games': (self.wins + self.wins.T).sum(axis=1),
+        }).sort_values(by='rating', ascending=False, ignore_index=True)
+
+    def open_pairings(self):
+        """Pairings that need more games: their rating intervals overlap and
+        they haven't played max_games yet
+
+        Returns:
+            List of tuples (i, j) of strategy indices
+        """
+        games = self.wins + self.wins.T
+        pairings = itertools.combinations(range(len(self.names)), 2)
+        if not self.rounds:
+            return list(pairings)
+        ratings = self.ratings().set_index('strategy')
+        low, high = ratings.rating_low, ratings.rating_high
+        return [(i, j) for i, j in pairings
+                if games[i, j] < self.max_games
+                and low[self.names[i]] < high[self.names[j]]
+                and low[self.names[j]] < high[self.names[i]]]
+
+    def play_round(self, executor=None):
+        """Plays games_per_round games for every open pairing
+
+        Returns:
+            Number of pairings played
+        """
+        pairings = self.open_pairings()
+        games = self.wins + self.wins.T
+        tasks = [(self.strategies[self.names[i]],
+                  self.strategies[self.names[j]],
+                  min(self.games_per_round, self.max_games - games[i, j]),
+                  self._seed_rng.getrandbits(64))
+                 for i, j in pairings]
+        if executor is None:
+            results = [_play_pairing(task) for task in tasks]
+        else:
+            results = executor.map(_play_pairing, tasks)
+        for (i, j), (task, games_won) in zip(pairings, zip(tasks, results)):
+            self.wins[i, j] += games_won
+            self.wins[j, i] += task[2] - games_won
+        self.rounds += 1
+        return len(pairings)
+
+    def run(self, use_processes=True):
+        """Plays rounds until no pairing is open
+
+        Returns:
+            The final ratings, see ratings
+        """
+        if use_processes:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                while self.play_round(executor):
+                    pass
+        else:
+            while self.play_round():
+                pass
+        return self.ratings()
+
+    def report(self):
+        """Prints the ratings table and the games saved compared to a round
+        robin playing max_games per pairing
+        """
+        n_pairings = len(self.names) * (len(self.names) - 1) // 2
+        fixed = n_pairings * self.max_games
+        print(self.ratings().to_string(index=False, float_format='%.0f'))
+        print(f"{self.games_played} games in {self.rounds} rounds, "
+              f"{fixed} in a fixed round robin "
+              f"({self.games_played / max(fixed, 1):.0%}).")
+
+
+def _play_pairing(task):
+    """Plays games between two strategies
+
+    Args:
+        task: A tuple (strategy_func, opponent_strategy_func, n_games, seed)
+
+    Returns:
+        Number of games won by strategy_func
+    """
+    strategy_func, opponent_strategy_func, n_games, seed = task
+    session = pazaak.GameSession(
+        Player.create_computer("Player", strategy_func),
+        Player.create_computer("Opponent", opponent_strategy_func),
+        events=NullSink())
+    return session.play_n_games_parallel(
+        n_games, workers=1, seed=seed, use_processes=False).games_won
+
+
+def main():
+    """Rates the built-in strategies"""
+    tournament = Tournament({
+        'random': random_strategy,
+        'blackjack': blackjack_like_strategy,
+        'decision_tree': decision_tree_strategy,
+        'random_forest': random_forest_strategy,
+    }, seed=42)
+    tournament.run()
+    tournament.report()
+
+
+if __name__ == '__main__':
+    main()
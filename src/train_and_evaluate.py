@@ -1,25 +1,37 @@
 """Wrapper module to train different models and let them play"""
 
+import csv
+import functools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from timeit import default_timer as timer
 
+from sklearn.base import clone
 from sklearn.tree import DecisionTreeRegressor
 from sklearn.ensemble import RandomForestRegressor
 
 import pandas as pd
 
-from computer_learn import train_model
+from computer_learn import load_dataset, fit_model
 from pazaak_player import AbstractPlayer as Player
 import pazaak
-from computer_strategies import blackjack_like_strategy, decision_tree_strategy
-from misc import suppress_stdout
+from computer_strategies import blackjack_like_strategy, ml_trainee_strategy
+from events import NullSink
+from sequential import SequentialResult
+from paired_evaluation import compare_strategies
+from pazaak_constants import MODEL_SCORES_FILE_NAME
+
+RESULT_COLUMNS = ['model', 'test_score', 'win_pctg', 'win_pctg_low',
+                  'win_pctg_high', 'decision', 'n_games', 'duration']
+
+# Datasets of the worker processes, see run_grid
+_datasets = {}
 
 
 def main():
     """Trains a model, then plays against computer"""
 
-    function_start = timer()
-    results = pd.DataFrame(columns=['model', 'test_score', 'win_pctg'])
-
     # Your favourite model goes here:
     models = {
         'DT_3': DecisionTreeRegressor(max_depth=3, random_state=42),
@@ -32,45 +44,177 @@ def main():
         'RF_5': RandomForestRegressor(n_estimators=10, max_depth=5,
                                       random_state=42),
     }
+    datasets = {str(rand_percentage):
+                f"resources/result_50k_{rand_percentage}.csv"
+                for rand_percentage in [80, 85, 90, 95]}
+
+    run_grid(models, datasets)
+
+
+def games_to_play(model):
+    """Number of evaluation games of a model
+
+    Since our random forests use 10 decision tree estimators, the decision
+    trees are ~10x faster.
+    """
+    return 1000 if isinstance(model, DecisionTreeRegressor) else 200
+
+
+def run_grid(models, datasets, workers=None, seed=42,
+             results_file_name=MODEL_SCORES_FILE_NAME, sequential=True):
+    """Fits every model on every dataset and lets it play against the
+    blackjack-like strategy
+
+    Every dataset is read and feature-engineered once, then shared with a
+    pool of processes. Each (model, dataset) pair is fitted on a copy of the
+    model and evaluated in memory, so pairs don't interfere. Results are
+    appended to results_file_name as soon as a pair is done. Pairs found in
+    that file are skipped, so an interrupted grid is resumed by running it
+    again. Once all pairs are done, the file is sorted by win percentage.
+
+    By default, every pair plays until a sequential test decides whether it
+    beats the blackjack-like strategy more or less than half of the time
+    (see GameSession.play_until_decided), at most games_to_play games.
+
+    Args:
+        models: dict mapping model names to unfitted models
+        datasets: dict mapping dataset names to csv files
+        workers: Number of processes. Default: number of CPUs
+        seed: Seed of the evaluation games. Default: 42
+        results_file_name: csv file the results are written to
+        sequential: Whether to stop playing once the test is decided, rather
+            than playing games_to_play games. Default: True
+
+    Returns:
+        DataFrame containing the results of all pairs
+    """
+    function_start = timer()
+    done = set()
+    if os.path.exists(results_file_name):
+        done = set(pd.read_csv(results_file_name).model)
+    pairs = [(f"{model_name}_{dataset_name}", model, dataset_name)
+             for model_name, model in models.items()
+             for dataset_name in datasets
+             if f"{model_name}_{dataset_name}" not in done]
+    print(f"{len(done)} results found, {len(pairs)} pairs to go.")
+
+    if pairs:
+        loaded = {dataset_name: load_dataset(datasets[dataset_name])
+                  for dataset_name in {pair[2] for pair in pairs}}
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_set_datasets,
+                                 initargs=(loaded,)) as executor:
+            futures = [executor.submit(_evaluate_pair, model_desc, model,
+                                       dataset_name, seed, sequential)
+                       for model_desc, model, dataset_name in pairs]
+            for future in as_completed(futures):
+                result = future.result()
+                _append_result(result, results_file_name)
+                print(f"{result['model']} won {result['win_pctg']:.1%} of "
+                      f"{result['n_games']} games in "
+                      f"{result['duration']:.1f} seconds. "
+                      f"Test score: {result['test_score']:.3f}")
+
+    results = pd.read_csv(results_file_name).sort_values(
+        by='win_pctg', ascending=False)
+    results.to_csv(results_file_name, index=False)
+    total_duration = timer() - function_start
+    print(f"Total execution took {total_duration:.1f} seconds. Results:")
+    print(results)
+    return results
+
+
+def compare_models(models, dataset_file_name, n_games=1000, seed=42,
+                   baseline=None):
+    """Fits models on a dataset and compares them on common random numbers:
+    every model plays the same games against the blackjack-like strategy,
+    see paired_evaluation.compare_strategies
+
+    Args:
+        models: dict mapping model names to unfitted models
+        dataset_file_name: Dataset to fit the models on
+        n_games: Number of games per model. Default: 1000
+        seed: Master seed of the games. Default: 42
+        baseline: Name of the model the others are compared with. Default:
+            the first one
+
+    Returns:
+        DataFrame of the comparison, see compare_strategies
+    """
+    X, y = load_dataset(dataset_file_name)
+    strategies = {}
+    for model_name, model in models.items():
+        regressor = clone(model)
+        fit_model(regressor, X, y)
+        strategies[model_name] = functools.partial(ml_trainee_strategy,
+                                                   regressor=regressor)
+    comparison = compare_strategies(strategies, n_games=n_games, seed=seed,
+                                    baseline=baseline)
+    print(comparison)
+    return comparison
+
+
+def _set_datasets(datasets):
+    """Process pool initializer: Stores the loaded datasets"""
+    _datasets.update(datasets)
+
+
+def _evaluate_pair(model_desc, model, dataset_name, seed, sequential):
+    """Fits a copy of model on a loaded dataset, then lets it play
+
+    Returns:
+        dict containing the RESULT_COLUMNS
+    """
+    start = timer()
+    regressor = clone(model)
+    test_score = fit_model(regressor, *_datasets[dataset_name])
+
+    n_games = games_to_play(model)
+    # Separate streams for the games and for the random module
+    seed_rng = random.Random(seed)
+    session_seed = seed_rng.getrandbits(64)
+    random.seed(seed_rng.getrandbits(64))
+    session = pazaak.GameSession(
+        Player.create_computer("MLTrainee", functools.partial(
+            ml_trainee_strategy, regressor=regressor)),
+        Player.create_computer("Opponent", blackjack_like_strategy),
+        random.Random(session_seed), events=NullSink())
+    if sequential:
+        result = session.play_until_decided(max_games=n_games)
+    else:
+        result = SequentialResult(None, n_games,
+                                  session.play_n_games(n_games), 0.)
+    win_pctg_low, win_pctg_high = result.confidence_interval()
+    return {
+        'model': model_desc,
+        'test_score': test_score,
+        'win_pctg': result.win_rate,
+        'win_pctg_low': win_pctg_low,
+        'win_pctg_high': win_pctg_high,
+        'decision': result.decision,
+        'n_games': result.games,
+        'duration': timer() - start,
+    }
+
 
-    pazaak.player = Player.create_computer("MLTrainee",
-                                           decision_tree_strategy)
-    pazaak.opponent = Player.create_computer("Opponent",
-                                             blackjack_like_strategy)
-
-    for model_name in models:
-        model = models[model_name]
-        # Since our random forests use 10 decision tree estimators, the
-        # decision trees are ~10x faster
-        if isinstance(model, DecisionTreeRegressor):
-            n_games = 1000
-        else:
-            n_games = 200
-
-        for rand_percentage in [80, 85, 90, 95]:
-            train_file_name = f"resources/result_50k_{rand_percentage}.csv"
-            model_desc = f"{model_name}_{rand_percentage}"
-
-            start = timer()
-            print(f"Training model {model_name} on {train_file_name}")
-            test_score = train_model(model, train_file_name)
-
-            with suppress_stdout():
-                games_won = pazaak.play_n_games(n_games)
-            end = timer()
-            duration = int(end - start)
-            gps = int(n_games / duration)
-            print(f"{model_name} won {games_won} games out of {n_games} "
-                  f"in {duration} seconds ({gps} games per second)")
-            results = results.append({
-                'model': model_desc,
-                'test_score': test_score,
-                'win_pctg': games_won / n_games
-            }, ignore_index=True)
-
-    total_duration = int(timer() - function_start)
-    print(f"Total execution took {total_duration} seconds. Results:")
-    results.sort_values(by='win_pctg', ascending=False).to_csv('resources/model_scores.csv')
+def _append_result(result, results_file_name):
+    """Appends a result to the results file, creating it if needed. Columns
+    missing in an existing file are dropped. The row is on disk once this
+    returns, so an interrupted grid doesn't play the pair again.
+    """
+    new_file = not os.path.exists(results_file_name)
+    fieldnames = RESULT_COLUMNS
+    if not new_file:
+        with open(results_file_name, newline='') as results_file:
+            fieldnames = next(csv.reader(results_file))
+    with open(results_file_name, 'a', newline='') as results_file:
+        writer = csv.DictWriter(results_file, fieldnames=fieldnames,
+                                extrasaction='ignore')
+        if new_file:
+            writer.writeheader()
+        writer.writerow(result)
+        results_file.flush()
+        os.fsync(results_file.fileno())
 
 
 if __name__ == '__main__':
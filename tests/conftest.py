@@ -0,0 +1,7 @@
+"""Makes the modules in src importable by the tests"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'src'))
@@ -0,0 +1,22 @@
+"""Tests of the vectorized batch simulator"""
+
+import pytest
+
+from batch_simulator import compare_with_scalar_engine
+from computer_strategies import blackjack_like_strategy, random_strategy
+
+# Sets per engine and bound of the z statistics. Six statistics are tested,
+# so the bound keeps false alarms negligible for any seed, while a
+# difference of one percentage point in any share gives |z| of about 5.
+N_SETS = 100000
+MAX_Z = 4.
+
+
+@pytest.mark.parametrize('opponent_strategy',
+                         [random_strategy, blackjack_like_strategy])
+def test_batch_engine_matches_scalar_engine(opponent_strategy):
+    comparison = compare_with_scalar_engine(
+        N_SETS, blackjack_like_strategy, opponent_strategy, seed=42)
+    for outcome, (p_scalar, p_batch, z_stat) in comparison.items():
+        assert abs(z_stat) < MAX_Z, (
+            f"{outcome}: scalar {p_scalar:.4f}, batch {p_batch:.4f}")
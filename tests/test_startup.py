@@ -0,0 +1,49 @@
+"""Tests of the game's startup: no ML dependencies are loaded and the
+import stays within its time budget
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       os.pardir, 'src')
+HEAVY_MODULES = ('numpy', 'joblib', 'sklearn', 'pandas')
+# Import time budget of pazaak, in seconds
+IMPORT_BUDGET = .1
+
+
+def _run(code, *options):
+    return subprocess.run([sys.executable, *options, '-c', code],
+                          capture_output=True, text=True, check=True,
+                          cwd=SRC_DIR)
+
+
+def test_import_loads_no_ml_dependencies():
+    output = _run("import sys, pazaak; print(' '.join(sys.modules))").stdout
+    loaded = set(output.split())
+    assert not [module for module in HEAVY_MODULES if module in loaded]
+
+
+def test_import_time_within_budget():
+    times = []
+    # The fastest of a few interpreters counts, as in benchmarks.import_time
+    for _ in range(5):
+        output = _run('import pazaak', '-X', 'importtime').stderr
+        for line in output.splitlines():
+            if line.count('|') != 2:
+                continue
+            _, cumulative, name = line.split('|')
+            if name.strip() == 'pazaak':
+                times.append(int(cumulative) / 1e6)
+    assert min(times) < IMPORT_BUDGET
+
+
+def test_missing_model_file_rejected(tmp_path, monkeypatch, capsys):
+    import pazaak
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit):
+        pazaak.main(['--opponent', 'optimal'])
+    assert 'python solver.py' in capsys.readouterr().err